@@ -0,0 +1,409 @@
+"""
+楽天ページのクロールスケジューラー
+
+検索ページ → 商品ページ → レビューページの優先度付きキューでURLを管理し、
+ホストごとのアクセス間隔（ポライトネス）を守りながら取得する。
+ブロックページ（403/429、短すぎるHTML、キャプチャ画面）を検出し、
+ブロック率に応じて同時実行数を自動調整する（AIMD方式）。
+
+現在 Vercel Function から使われているのは detect_block_page のみで、
+CrawlScheduler は複数ページを一括取得するバッチ処理向けのライブラリ。
+
+※ api/ 配下ですが先頭が "_" のため Vercel Function としては公開されません
+"""
+
+import heapq
+import itertools
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+# 優先度（小さいほど先に取得）
+PRIORITY_SEARCH = 0
+PRIORITY_ITEM = 1
+PRIORITY_REVIEW = 2
+
+# proxy-rakuten.py の既存チェックと同じ閾値
+MIN_HTML_LENGTH = 100
+
+# アクセス制限ページの <title> に含まれる文言
+BLOCK_TITLE_MARKERS = [
+    'access denied',
+    'captcha',
+    'アクセスが集中',
+    'アクセスが制限',
+    '不正なアクセス',
+    'ロボットではありません',
+]
+# キャプチャ画面のウィジェット（本文中の単語 "captcha" だけでは判定しない）
+CAPTCHA_WIDGET_MARKERS = [
+    'class="g-recaptcha',
+    'class="h-captcha',
+    'www.google.com/recaptcha/api',
+    'hcaptcha.com/1/api',
+    'name="captcha',
+    'id="captcha',
+]
+TITLE_PATTERN = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+# ブロックページとみなすHTMLの最大長（正常な検索・商品ページはこれより十分大きい）
+BLOCK_PAGE_MAX_LENGTH = 20000
+
+BLOCK_STATUS_CODES = (403, 429)
+
+
+def classify_url(url: str) -> int:
+    """
+    URLから取得優先度を判定する
+
+    Args:
+        url: 楽天のURL
+
+    Returns:
+        PRIORITY_SEARCH / PRIORITY_ITEM / PRIORITY_REVIEW
+    """
+    hostname = urlparse(url).hostname or ''
+    if hostname.startswith('search.'):
+        return PRIORITY_SEARCH
+    if hostname.startswith('review.'):
+        return PRIORITY_REVIEW
+    return PRIORITY_ITEM
+
+
+def detect_block_page(html: Optional[str], status_code: int = 200) -> Optional[str]:
+    """
+    ブロックページかどうかを判定する
+
+    Args:
+        html: レスポンスのHTML
+        status_code: HTTPステータスコード
+
+    Returns:
+        ブロックと判定した理由（正常なページの場合はNone）
+    """
+    if status_code in BLOCK_STATUS_CODES:
+        return f'status_{status_code}'
+
+    html = html or ''
+    if len(html) < MIN_HTML_LENGTH:
+        # Vercelのエラーレファレンスはブロックではなく内部エラー
+        if 'Reference' in html and '#' in html:
+            return 'error_reference'
+        return 'too_short'
+
+    # 長い正常ページで誤検知しないよう短いページのみ検査し、
+    # 本文中の単語ではなく <title> とキャプチャのウィジェットだけを見る
+    if len(html) <= BLOCK_PAGE_MAX_LENGTH:
+        lowered = html.lower()
+        title_match = TITLE_PATTERN.search(lowered)
+        title = title_match.group(1) if title_match else ''
+        if any(marker in title for marker in BLOCK_TITLE_MARKERS):
+            return 'captcha'
+        if any(marker in lowered for marker in CAPTCHA_WIDGET_MARKERS):
+            return 'captcha'
+
+    return None
+
+
+class HostPoliteness:
+    """
+    ホストごとの最小アクセス間隔を管理する
+
+    Args:
+        min_interval: 同一ホストへのリクエスト間隔（秒）
+        max_interval: ブロック時に延長する間隔の上限（秒）
+    """
+
+    def __init__(self, min_interval: float = 1.0, max_interval: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next_allowed = {}
+        self._intervals = {}
+
+    def interval(self, host: str) -> float:
+        return self._intervals.get(host, self.min_interval)
+
+    def delay(self, host: str) -> float:
+        """次にアクセスできるまでの待ち時間（秒）"""
+        with self._lock:
+            return max(0.0, self._next_allowed.get(host, 0.0) - self._clock())
+
+    def try_acquire(self, host: str) -> bool:
+        """アクセス可能なら枠を確保してTrueを返す"""
+        with self._lock:
+            now = self._clock()
+            if self._next_allowed.get(host, 0.0) > now:
+                return False
+            self._next_allowed[host] = now + self.interval(host)
+            return True
+
+    def penalize(self, host: str) -> None:
+        """ブロックされたホストのアクセス間隔を2倍に延長する"""
+        with self._lock:
+            interval = min(self.max_interval, self.interval(host) * 2)
+            self._intervals[host] = interval
+            self._next_allowed[host] = max(self._next_allowed.get(host, 0.0), self._clock() + interval)
+
+    def relax(self, host: str) -> None:
+        """成功時にアクセス間隔を少しずつ元に戻す"""
+        with self._lock:
+            interval = self._intervals.get(host)
+            if interval is None:
+                return
+            interval = max(self.min_interval, interval * 0.9)
+            if interval <= self.min_interval:
+                del self._intervals[host]
+            else:
+                self._intervals[host] = interval
+
+
+class CrawlScheduler:
+    """
+    優先度付きキューとブロック検出を備えたクロールスケジューラー
+
+    Args:
+        fetch: URLを受け取り (status_code, html) を返す関数
+        min_host_interval: 同一ホストへの最小アクセス間隔（秒）
+        initial_concurrency: 初期同時実行数
+        min_concurrency / max_concurrency: 同時実行数の範囲
+        window_size: ブロック率を計算する直近のリクエスト数
+        block_rate_high: これを超えると同時実行数を半減
+        block_rate_low: これを下回ると同時実行数を1増やす
+        max_retries: ブロックされたURLの再キュー回数
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Tuple[int, str]],
+        min_host_interval: float = 1.0,
+        initial_concurrency: int = 2,
+        min_concurrency: int = 1,
+        max_concurrency: int = 8,
+        window_size: int = 20,
+        block_rate_high: float = 0.1,
+        block_rate_low: float = 0.02,
+        max_retries: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.fetch = fetch
+        self.politeness = HostPoliteness(min_host_interval, clock=clock)
+        self.concurrency = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.block_rate_high = block_rate_high
+        self.block_rate_low = block_rate_low
+        self.max_retries = max_retries
+        self._clock = clock
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._seen = set()
+        self._in_flight = 0
+        self._window = deque(maxlen=window_size)
+        self._results = []
+        self._started_at = None
+
+        self.stats = {
+            'fetched': 0,
+            'succeeded': 0,
+            'blocked': 0,
+            'errors': 0,
+            'retried': 0,
+            'dropped': 0,
+            'concurrency_changes': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # キュー操作
+    # ------------------------------------------------------------------
+
+    def add(self, url: str, priority: Optional[int] = None) -> bool:
+        """
+        URLをキューに追加する（追加済みのURLは無視）
+
+        Returns:
+            追加した場合True
+        """
+        with self._cond:
+            if url in self._seen:
+                return False
+            self._seen.add(url)
+            self._push(url, classify_url(url) if priority is None else priority, 0)
+            return True
+
+    def _push(self, url: str, priority: int, attempt: int) -> None:
+        heapq.heappush(self._heap, (priority, next(self._seq), url, attempt))
+        self._cond.notify_all()
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def _next_ready(self) -> Tuple[Optional[tuple], float]:
+        """
+        アクセス可能なホストの中で最も優先度の高いURLを取り出す
+
+        Returns:
+            (キューのエントリ, 全ホスト待機中の場合の最短待ち時間)
+        """
+        skipped = []
+        entry = None
+        wait = None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            host = urlparse(candidate[2]).hostname or ''
+            if self.politeness.try_acquire(host):
+                entry = candidate
+                break
+            delay = self.politeness.delay(host)
+            wait = delay if wait is None else min(wait, delay)
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        return entry, (wait or 0.0)
+
+    # ------------------------------------------------------------------
+    # 実行
+    # ------------------------------------------------------------------
+
+    def run(self, on_result: Optional[Callable[[Dict], Optional[List[str]]]] = None) -> List[Dict]:
+        """
+        キューが空になるまでクロールする
+
+        Args:
+            on_result: 取得結果ごとに呼ばれる関数。追加でクロールするURLのリストを返せる
+                       （検索ページから商品URLを、商品ページからレビューURLを追加する用途）
+
+        Returns:
+            取得結果のリスト {"url", "status_code", "html", "blocked", "reason", "elapsed_ms"}
+        """
+        self._started_at = self._clock()
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for _ in range(self.max_concurrency):
+                executor.submit(self._worker, on_result)
+        return self._results
+
+    def _worker(self, on_result) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap and self._in_flight == 0:
+                        self._cond.notify_all()
+                        return
+                    if self._heap and self._in_flight < self.concurrency:
+                        entry, wait = self._next_ready()
+                        if entry is not None:
+                            self._in_flight += 1
+                            break
+                        self._cond.wait(timeout=wait)
+                    else:
+                        self._cond.wait(timeout=1.0)
+
+            priority, _, url, attempt = entry
+            result = self._fetch_one(url)
+
+            # 追加URLをキューに入れてから in_flight を減らす（他のワーカーの早期終了を防ぐ）
+            if on_result is not None and result['reason'] is None:
+                try:
+                    for new_url in on_result(result) or []:
+                        self.add(new_url)
+                except Exception as error:
+                    print(f'❌ クロール結果の処理でエラー: {error}')
+
+            with self._cond:
+                self._in_flight -= 1
+                self._record(url, priority, attempt, result)
+                self._cond.notify_all()
+
+    def _fetch_one(self, url: str) -> Dict:
+        start = self._clock()
+        status_code = 0
+        html = ''
+        reason = None
+        try:
+            status_code, html = self.fetch(url)
+            reason = detect_block_page(html, status_code)
+        except Exception as error:
+            print(f'❌ クロール取得エラー ({url}): {error}')
+            reason = 'error'
+        return {
+            'url': url,
+            'status_code': status_code,
+            'html': html,
+            'blocked': reason not in (None, 'error', 'error_reference'),
+            'reason': reason,
+            'elapsed_ms': int((self._clock() - start) * 1000),
+        }
+
+    def _record(self, url: str, priority: int, attempt: int, result: Dict) -> None:
+        """取得結果を記録し、ブロック率に応じて同時実行数を調整する（ロック内で呼ぶ）"""
+        host = urlparse(url).hostname or ''
+        self.stats['fetched'] += 1
+        self._window.append(result['blocked'])
+
+        if result['blocked']:
+            self.stats['blocked'] += 1
+            self.politeness.penalize(host)
+            print(f'🚫 ブロック検出 ({result["reason"]}): {url}')
+        elif result['reason'] is not None:
+            self.stats['errors'] += 1
+        else:
+            self.stats['succeeded'] += 1
+            self.politeness.relax(host)
+
+        if result['reason'] is not None:
+            if attempt < self.max_retries:
+                self.stats['retried'] += 1
+                self._push(url, priority, attempt + 1)
+            else:
+                self.stats['dropped'] += 1
+                self._results.append(result)
+        else:
+            self._results.append(result)
+
+        self._adjust_concurrency()
+
+    def block_rate(self) -> float:
+        if not self._window:
+            return 0.0
+        return sum(self._window) / len(self._window)
+
+    def _adjust_concurrency(self) -> None:
+        rate = self.block_rate()
+        previous = self.concurrency
+        if rate > self.block_rate_high:
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            # 半減後は判定をやり直す
+            if self.concurrency != previous:
+                self._window.clear()
+        elif rate < self.block_rate_low and len(self._window) >= self._window.maxlen // 2:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+            if self.concurrency != previous:
+                self._window.clear()
+        if self.concurrency != previous:
+            self.stats['concurrency_changes'] += 1
+            print(f'⚙️ 同時実行数を調整: {previous} → {self.concurrency} (ブロック率 {rate:.0%})')
+
+    # ------------------------------------------------------------------
+    # メトリクス
+    # ------------------------------------------------------------------
+
+    def metrics(self) -> Dict:
+        """キュー深さ・ブロック率・1分あたりの取得件数を返す"""
+        elapsed = (self._clock() - self._started_at) if self._started_at is not None else 0.0
+        per_minute = (self.stats['succeeded'] / elapsed * 60) if elapsed > 0 else 0.0
+        return {
+            'queueDepth': self.queue_depth(),
+            'concurrency': self.concurrency,
+            'blockRate': round(self.block_rate(), 3),
+            'pagesPerMinute': round(per_minute, 1),
+            **self.stats,
+        }
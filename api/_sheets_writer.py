@@ -0,0 +1,351 @@
+"""
+Google Sheets 書き込みスケジューラー
+
+複数のキーワード・スプレッドシートからの書き込みをキューに溜め、
+スプレッドシートごとに1回の values.batchUpdate にまとめて送信する。
+1分あたりのクォータ使用量を追跡し、429 レスポンスにはジッター付きの
+指数バックオフで再試行する。
+
+※ api/ 配下ですが先頭が "_" のため Vercel Function としては公開されません
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+
+
+# Google Sheets API の書き込みクォータ（ユーザーあたり 60 リクエスト/分）
+DEFAULT_WRITES_PER_MINUTE = 60
+# 1回の batchUpdate に含める最大レンジ数
+DEFAULT_MAX_RANGES_PER_CALL = 100
+# リトライ設定
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 32.0
+# 1回の flush で待機できる上限（Vercel の maxDuration 60秒に収めるため）
+DEFAULT_DEADLINE_SECONDS = 25.0
+
+# 他の呼び出し元の flush を待つときの、期限に上乗せする猶予（API呼び出し1回分）
+WAIT_MARGIN_SECONDS = 10.0
+
+QUOTA_WINDOW_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = (429, 500, 503)
+
+
+class SheetsWriteError(Exception):
+    """書き込みが最終的に失敗した場合の例外"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """
+    例外から HTTP ステータスコードを取り出す
+
+    gspread.exceptions.APIError / requests.HTTPError / googleapiclient の
+    HttpError いずれにも対応する
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    if status is None:
+        status = getattr(error, 'status_code', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class GspreadSheetsService:
+    """
+    gspread クライアントを values.batchUpdate 用の最小インターフェースに変換する
+
+    スケジューラーは `values_batch_update(spreadsheet_id, body)` だけを
+    呼び出すため、テストではこのメソッドを持つ偽サービスに差し替えられる
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._spreadsheets = {}
+
+    def values_batch_update(self, spreadsheet_id: str, body: Dict) -> Dict:
+        # open_by_key はメタデータ取得の API 呼び出しを伴うためキャッシュする
+        spreadsheet = self._spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            spreadsheet = self.client.open_by_key(spreadsheet_id)
+            self._spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet.values_batch_update(body)
+
+
+class SheetsWriteScheduler:
+    """
+    クォータを考慮した Google Sheets 書き込みスケジューラー
+
+    Args:
+        service: `values_batch_update(spreadsheet_id, body)` を持つサービス
+        writes_per_minute: 1分あたりに許可する書き込みリクエスト数
+        max_ranges_per_call: 1回の batchUpdate に含める最大レンジ数
+        max_retries: 429/5xx 時の最大リトライ回数
+        base_backoff: バックオフの基準秒数
+        max_backoff: バックオフの上限秒数
+        deadline_seconds: 1回の flush でクォータ待ち・バックオフに使える上限秒数
+                          （超える場合は待たずに SheetsWriteError で失敗する）
+        value_input_option: RAW または USER_ENTERED
+        clock / sleep / rand: テスト用に差し替え可能な時間・乱数関数
+    """
+
+    def __init__(
+        self,
+        service,
+        writes_per_minute: int = DEFAULT_WRITES_PER_MINUTE,
+        max_ranges_per_call: int = DEFAULT_MAX_RANGES_PER_CALL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        base_backoff: float = DEFAULT_BASE_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+        value_input_option: str = 'RAW',
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rand: Callable[[], float] = random.random,
+    ):
+        self.service = service
+        self.writes_per_minute = writes_per_minute
+        self.max_ranges_per_call = max_ranges_per_call
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.deadline_seconds = deadline_seconds
+        self.value_input_option = value_input_option
+        self._clock = clock
+        self._sleep = sleep
+        self._rand = rand
+
+        self._lock = threading.Lock()
+        # spreadsheet_id -> OrderedDict(range -> (values, enqueued_at, [Future]))
+        self._pending = OrderedDict()
+        # 直近1分間の書き込みリクエスト送信時刻
+        self._call_times = deque()
+        self._latencies = deque(maxlen=1000)
+
+        self.stats = {
+            'enqueued': 0,
+            'merged': 0,
+            'calls': 0,
+            'ranges_written': 0,
+            'retries': 0,
+            'rate_limited': 0,
+            'failures': 0,
+            'throttle_seconds': 0.0,
+            'backoff_seconds': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # キュー操作
+    # ------------------------------------------------------------------
+
+    def enqueue(self, spreadsheet_id: str, range_name: str, values: List[List]) -> Future:
+        """
+        書き込みをキューに追加する
+
+        同じスプレッドシート・同じレンジへの未送信の書き込みは後勝ちでまとめる。
+        まとめられた書き込みの Future も、後の書き込みの送信結果で完了する。
+
+        Returns:
+            flush() で送信されたときに {"success": bool, "error": str, "statusCode": int}
+            で完了する Future（どの呼び出し元の flush で送信されても完了する）
+        """
+        future = Future()
+        with self._lock:
+            ranges = self._pending.setdefault(spreadsheet_id, OrderedDict())
+            futures = [future]
+            if range_name in ranges:
+                self.stats['merged'] += 1
+                futures = ranges.pop(range_name)[2] + futures
+            ranges[range_name] = (values, self._clock(), futures)
+            self.stats['enqueued'] += 1
+        return future
+
+    def queue_depth(self) -> int:
+        """未送信のレンジ数"""
+        with self._lock:
+            return sum(len(ranges) for ranges in self._pending.values())
+
+    def flush(self) -> Dict[str, Dict]:
+        """
+        キューに溜まった書き込みをすべて送信する
+
+        Returns:
+            スプレッドシートIDごとの結果
+            {"success": bool, "ranges": int, "calls": int, "error": str}
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = OrderedDict()
+
+        deadline = self._clock() + self.deadline_seconds
+        results = {}
+        for spreadsheet_id, ranges in pending.items():
+            items = list(ranges.items())
+            result = {'success': True, 'ranges': len(items), 'calls': 0}
+            try:
+                for start in range(0, len(items), self.max_ranges_per_call):
+                    chunk = items[start:start + self.max_ranges_per_call]
+                    try:
+                        self._send(spreadsheet_id, chunk, deadline)
+                    except SheetsWriteError as error:
+                        print(f'❌ スプレッドシート書き込み失敗 ({spreadsheet_id}): {error}')
+                        result['success'] = False
+                        result['error'] = str(error)
+                        result['statusCode'] = error.status_code
+                        # 失敗したチャンクと未送信のチャンクの全呼び出し元に失敗を通知する
+                        self._resolve(items[start:], {
+                            'success': False,
+                            'error': str(error),
+                            'statusCode': error.status_code,
+                        })
+                        break
+                    result['calls'] += 1
+                    self._resolve(chunk, {'success': True})
+            finally:
+                # 想定外の例外でも Future を未完了のまま残さない
+                self._resolve(items, {'success': False, 'error': '書き込みが完了しませんでした'})
+            results[spreadsheet_id] = result
+        return results
+
+    def wait(self, future: Future, timeout: Optional[float] = None) -> Dict:
+        """
+        enqueue() の Future の結果を待つ
+
+        別の呼び出し元の flush() で送信中の場合もその結果を受け取る。
+        結果が得られない場合は成功扱いにせず失敗を返す。
+
+        Args:
+            future: enqueue() の戻り値
+            timeout: 待機の上限秒数（省略時は deadline_seconds + WAIT_MARGIN_SECONDS）
+
+        Returns:
+            {"success": bool, "error": str, "statusCode": int}
+        """
+        if timeout is None:
+            timeout = self.deadline_seconds + WAIT_MARGIN_SECONDS
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            return {'success': False, 'error': '書き込み結果を確認できませんでした（タイムアウト）'}
+
+    @staticmethod
+    def _resolve(items: List, result: Dict) -> None:
+        """未完了の Future を結果で完了させる"""
+        for _, (_, _, futures) in items:
+            for future in futures:
+                if not future.done():
+                    future.set_result(dict(result))
+
+    # ------------------------------------------------------------------
+    # 送信・クォータ制御
+    # ------------------------------------------------------------------
+
+    def _send(self, spreadsheet_id: str, chunk: List, deadline: float) -> None:
+        body = {
+            'valueInputOption': self.value_input_option,
+            'data': [
+                {'range': range_name, 'values': values}
+                for range_name, (values, _, _) in chunk
+            ],
+        }
+        oldest_enqueued = min(enqueued_at for _, (_, enqueued_at, _) in chunk)
+
+        attempt = 0
+        while True:
+            self._wait_for_quota(deadline)
+            try:
+                self.service.values_batch_update(spreadsheet_id, body)
+            except Exception as error:
+                status_code = get_status_code(error)
+                retryable = status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries
+                delay = self._backoff_delay(attempt) if retryable else 0.0
+                message = str(error)
+                with self._lock:
+                    if status_code == 429:
+                        self.stats['rate_limited'] += 1
+                    if retryable and self._clock() + delay > deadline:
+                        retryable = False
+                        message = f'再試行の待機が期限を超えるため中止しました: {error}'
+                    if retryable:
+                        self.stats['retries'] += 1
+                        self.stats['backoff_seconds'] += delay
+                    else:
+                        self.stats['failures'] += 1
+                if not retryable:
+                    raise SheetsWriteError(message, status_code) from error
+
+                print(f'⏳ Sheets API {status_code}: {delay:.2f}秒後に再試行 ({attempt + 1}/{self.max_retries})')
+                self._sleep(delay)
+                attempt += 1
+                continue
+
+            with self._lock:
+                self.stats['calls'] += 1
+                self.stats['ranges_written'] += len(chunk)
+                self._latencies.append(self._clock() - oldest_enqueued)
+            return
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """フルジッター付き指数バックオフ"""
+        ceiling = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return ceiling * self._rand()
+
+    def _wait_for_quota(self, deadline: float) -> None:
+        """1分あたりのクォータを超える場合は枠が空くまで待機する"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                while self._call_times and now - self._call_times[0] >= QUOTA_WINDOW_SECONDS:
+                    self._call_times.popleft()
+                if len(self._call_times) < self.writes_per_minute:
+                    self._call_times.append(now)
+                    return
+                wait = QUOTA_WINDOW_SECONDS - (now - self._call_times[0])
+                if now + wait > deadline:
+                    self.stats['failures'] += 1
+                    raise SheetsWriteError('クォータの待機が期限を超えるため中止しました', 429)
+                self.stats['throttle_seconds'] += wait
+            self._sleep(wait)
+
+    # ------------------------------------------------------------------
+    # メトリクス
+    # ------------------------------------------------------------------
+
+    def quota_used(self) -> int:
+        """直近1分間に送信した書き込みリクエスト数"""
+        with self._lock:
+            now = self._clock()
+            return sum(1 for t in self._call_times if now - t < QUOTA_WINDOW_SECONDS)
+
+    def metrics(self) -> Dict:
+        """キュー深さ・レイテンシ・クォータ使用状況を返す"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = dict(self.stats)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 1)
+
+        return {
+            'queueDepth': self.queue_depth(),
+            'quotaUsedPerMinute': self.quota_used(),
+            'quotaLimitPerMinute': self.writes_per_minute,
+            'latencyMs': {
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'max': percentile(100),
+            },
+            **stats,
+        }
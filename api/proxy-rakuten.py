@@ -5,28 +5,47 @@ Vercel Serverless Function
 注意: 商用利用では、楽天の利用規約を確認してください
 """
 
+import os
+import sys
 import json
 import urllib.parse
 from urllib.parse import urlparse
 import requests
 from http.server import BaseHTTPRequestHandler
 
+# 同じディレクトリの補助モジュール（"_"始まりはVercel Functionとして公開されない）
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _crawl_scheduler import detect_block_page
+
 class handler(BaseHTTPRequestHandler):
-    def do_OPTIONS(self):
-        """OPTIONSリクエストの処理（CORS用）"""
-        self.send_response(200)
+    def send_response(self, code, message=None):
+        """ステータス行の直後にCORSヘッダーを付与する（ステータス行より前にヘッダーを書かないため）"""
+        super().send_response(code, message)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+    
+    def do_OPTIONS(self):
+        """OPTIONSリクエストの処理（CORS用）"""
+        self.send_response(200)
+        self.end_headers()
+    
+    def send_blocked_response(self, status_code, reason):
+        """ブロック検出時のレスポンス（クライアント側でバックオフできるよう理由を返す）"""
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Retry-After', '30')
         self.end_headers()
+        self.wfile.write(json.dumps({
+            'error': '楽天サーバーにアクセスがブロックされました',
+            'blocked': True,
+            'reason': reason
+        }).encode('utf-8'))
     
     def do_GET(self):
         """GETリクエストの処理"""
         try:
-            # CORS設定
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-            self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+            # CORS設定はsend_responseで付与
             
             # クエリパラメータを取得
             parsed_path = urllib.parse.urlparse(self.path)
@@ -135,6 +154,13 @@ class handler(BaseHTTPRequestHandler):
                 print(f'URL: {response.url}')
                 print(f'Headers: {dict(response.headers)}')
                 
+                # 403/429はボット検出によるブロックとして返す
+                block_reason = detect_block_page(response.text, response.status_code)
+                if block_reason in ('status_403', 'status_429'):
+                    print(f'🚫 楽天サーバーにブロックされました ({block_reason}): {response.status_code}')
+                    self.send_blocked_response(response.status_code, block_reason)
+                    return
+                
                 if not response.ok:
                     error_text = response.text[:500] if response.text else 'エラーレスポンスの取得に失敗'
                     print(f'❌ 楽天サーバーエラー ({response.status_code}): {error_text}')
@@ -151,18 +177,24 @@ class handler(BaseHTTPRequestHandler):
                 print(f'Status: {response.status_code} {response.reason}')
                 
                 # HTMLが短すぎる場合はエラー
-                if len(html) < 100:
+                if block_reason in ('too_short', 'error_reference'):
                     print(f'❌ HTMLが短すぎます: {html}')
                     print(f'HTML内容（全文）: {html}')
                     print(f'レスポンスURL: {response.url}')
                     print(f'ステータスコード: {response.status_code}')
                     
                     # Vercelのエラーレファレンスの可能性を確認
-                    if 'Reference' in html and '#' in html:
+                    if block_reason == 'error_reference':
                         print('❌ Vercelのエラーレファレンスが返されました。これはVercel Functionsの内部エラーです。')
                     
                     raise Exception(f'HTMLが短すぎます ({len(html)}文字): {html[:100]}')
                 
+                # キャプチャ・アクセス制限ページの場合はブロックとして返す
+                if block_reason:
+                    print(f'🚫 ブロックページを検出しました ({block_reason}): {html[:500]}')
+                    self.send_blocked_response(503, block_reason)
+                    return
+                
                 # HTMLの最初と最後をログに出力
                 print(f'HTML（最初の500文字）: {html[:500]}')
                 print(f'HTML（最後の500文字）: {html[-500:]}')
@@ -5,12 +5,20 @@ Google Spreadsheetへの書き込み機能も含む
 """
 
 import os
+import sys
 import json
 import re
-from typing import List, Dict, Optional
+from array import array
+from html.parser import HTMLParser
+from itertools import islice
+from typing import Iterator, List, Dict, Optional
 from bs4 import BeautifulSoup
 import requests
 
+# 同じディレクトリの補助モジュール（"_"始まりはVercel Functionとして公開されない）
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from _sheets_writer import SheetsWriteScheduler, GspreadSheetsService
+
 # Google Sheets API用（オプション）
 try:
     import gspread
@@ -70,180 +78,343 @@ def extract_product_info(html_content: str) -> List[Dict]:
             continue
         processed_containers.add(container_id)
         
-        product = {
-            "name": "",
-            "price": "",
-            "image_url": img.get("src", ""),
-            "image_alt": img.get("alt", ""),
-            "product_url": "",
-            "review_rating": "",
-            "review_count": "",
-            "shop_name": "",
-            "shipping_info": "",
-            "shipping_price": "",
-            "point_info": "",
-            "additional_info": {}
-        }
-        
-        # 商品名を取得
-        # 優先順位: h2/h3内のaタグ > itemを含むhrefのaタグ > title属性
-        name_link = None
-        for selector in [
-            container.find("h2"),
-            container.find("h3"),
-            container.find("a", href=re.compile(r'/item/')),
-            container.find("a", title=True)
-        ]:
-            if selector:
-                if selector.name == 'h2' or selector.name == 'h3':
-                    name_link = selector.find("a")
-                else:
-                    name_link = selector
-                if name_link:
-                    break
-        
-        if name_link:
-            product["name"] = name_link.get_text(strip=True)
-            href = name_link.get("href", "")
-            if href:
-                # 相対URLを絶対URLに変換
-                if href.startswith("//"):
-                    product["product_url"] = "https:" + href
-                elif href.startswith("/"):
-                    product["product_url"] = "https://search.rakuten.co.jp" + href
-                else:
-                    product["product_url"] = href
+        product = _extract_from_container(container, img.get("src", ""), img.get("alt", ""))
+        if product:
+            products.append(product)
+    
+    return products
+
+
+def _extract_from_container(container, image_url: str, image_alt: str) -> Optional[Dict]:
+    """
+    商品コンテナ要素から商品情報を抽出する
+    
+    Args:
+        container: 商品コンテナのBeautifulSoup要素
+        image_url: 商品画像のURL
+        image_alt: 商品画像のalt属性
         
-        # 商品名が取得できなかった場合は、画像のalt属性から取得
-        if not product["name"] and product["image_alt"]:
-            alt_text = product["image_alt"]
-            if len(alt_text) > 100:
-                product["name"] = alt_text[:100] + "..."
+    Returns:
+        商品情報（商品名が取得できない場合はNone）
+    """
+    product = {
+        "name": "",
+        "price": "",
+        "image_url": image_url,
+        "image_alt": image_alt,
+        "product_url": "",
+        "review_rating": "",
+        "review_count": "",
+        "shop_name": "",
+        "shipping_info": "",
+        "shipping_price": "",
+        "point_info": "",
+        "additional_info": {}
+    }
+    
+    # 商品名を取得
+    # 優先順位: h2/h3内のaタグ > itemを含むhrefのaタグ > title属性
+    name_link = None
+    for selector in [
+        container.find("h2"),
+        container.find("h3"),
+        container.find("a", href=re.compile(r'/item/')),
+        container.find("a", title=True)
+    ]:
+        if selector:
+            if selector.name == 'h2' or selector.name == 'h3':
+                name_link = selector.find("a")
             else:
-                product["name"] = alt_text
-        
-        # 価格を取得
-        # まず、価格専用のクラスを持つ要素を探す（商品名要素は除外）
-        price_elements = container.find_all(class_=re.compile(r'price', re.I))
-        for price_elem in price_elements:
-            # 商品名を含む要素は除外
-            if price_elem.find_parent("h2") or price_elem.find_parent("h3"):
-                continue
-            if price_elem.find("a", href=re.compile(r'/item/')):
-                continue
-            
-            price_text = price_elem.get_text(strip=True)
-            # 価格パターン: 数値+円 または ¥+数値 の形式で、短いテキストのみ
-            price_match = re.search(r'([\d,]+円|¥[\d,]+|[\d,]+円/本)', price_text)
-            if price_match and len(price_text) < 100:
-                product["price"] = price_match.group(1)
+                name_link = selector
+            if name_link:
                 break
+    
+    if name_link:
+        product["name"] = name_link.get_text(strip=True)
+        href = name_link.get("href", "")
+        if href:
+            # 相対URLを絶対URLに変換
+            if href.startswith("//"):
+                product["product_url"] = "https:" + href
+            elif href.startswith("/"):
+                product["product_url"] = "https://search.rakuten.co.jp" + href
+            else:
+                product["product_url"] = href
+    
+    # 商品名が取得できなかった場合は、画像のalt属性から取得
+    if not product["name"] and product["image_alt"]:
+        alt_text = product["image_alt"]
+        if len(alt_text) > 100:
+            product["name"] = alt_text[:100] + "..."
+        else:
+            product["name"] = alt_text
+    
+    # 価格を取得
+    # まず、価格専用のクラスを持つ要素を探す（商品名要素は除外）
+    price_elements = container.find_all(class_=re.compile(r'price', re.I))
+    for price_elem in price_elements:
+        # 商品名を含む要素は除外
+        if price_elem.find_parent("h2") or price_elem.find_parent("h3"):
+            continue
+        if price_elem.find("a", href=re.compile(r'/item/')):
+            continue
         
-        # 価格要素が見つからない場合、テキストノードから価格パターンを探す
-        if not product["price"]:
-            price_pattern = re.compile(r'([\d,]+円|¥[\d,]+|[\d,]+円/本)')
+        price_text = price_elem.get_text(strip=True)
+        # 価格パターン: 数値+円 または ¥+数値 の形式で、短いテキストのみ
+        price_match = re.search(r'([\d,]+円|¥[\d,]+|[\d,]+円/本)', price_text)
+        if price_match and len(price_text) < 100:
+            product["price"] = price_match.group(1)
+            break
+    
+    # 価格要素が見つからない場合、テキストノードから価格パターンを探す
+    if not product["price"]:
+        price_pattern = re.compile(r'([\d,]+円|¥[\d,]+|[\d,]+円/本)')
+        
+        for text_node in container.find_all(string=price_pattern):
+            parent = text_node.parent
+            if parent:
+                if parent.name in ['h2', 'h3']:
+                    continue
+                if parent.find("a", href=re.compile(r'/item/')):
+                    continue
+                if parent.find_parent("h2") or parent.find_parent("h3"):
+                    continue
             
-            for text_node in container.find_all(string=price_pattern):
-                parent = text_node.parent
-                if parent:
-                    if parent.name in ['h2', 'h3']:
-                        continue
-                    if parent.find("a", href=re.compile(r'/item/')):
-                        continue
-                    if parent.find_parent("h2") or parent.find_parent("h3"):
-                        continue
-                
-                price_text = text_node.strip()
-                if len(price_text) < 100:
-                    match = price_pattern.search(price_text)
-                    if match:
-                        product["price"] = match.group(1)
-                        break
-                    elif re.match(r'^[\d,]+円(/本)?\s*\(.*\)?$', price_text):
-                        product["price"] = price_text
-                        break
-        
-        # レビュー情報を取得
-        review_text_nodes = container.find_all(string=re.compile(r'\d+\.\d+\([\d,]+件\)'))
-        if review_text_nodes:
-            review_text = review_text_nodes[0].strip()
+            price_text = text_node.strip()
+            if len(price_text) < 100:
+                match = price_pattern.search(price_text)
+                if match:
+                    product["price"] = match.group(1)
+                    break
+                elif re.match(r'^[\d,]+円(/本)?\s*\(.*\)?$', price_text):
+                    product["price"] = price_text
+                    break
+    
+    # レビュー情報を取得
+    review_text_nodes = container.find_all(string=re.compile(r'\d+\.\d+\([\d,]+件\)'))
+    if review_text_nodes:
+        review_text = review_text_nodes[0].strip()
+        match = re.match(r'(\d+\.\d+)\(([\d,]+)件\)', review_text)
+        if match:
+            product["review_rating"] = match.group(1)
+            product["review_count"] = match.group(2)
+        else:
+            product["review_rating"] = review_text
+    
+    # レビューリンクからも取得を試みる
+    if not product["review_rating"]:
+        review_link = container.find("a", href=re.compile(r'review\.rakuten\.co\.jp/item'))
+        if review_link:
+            review_text = review_link.get_text(strip=True)
             match = re.match(r'(\d+\.\d+)\(([\d,]+)件\)', review_text)
             if match:
                 product["review_rating"] = match.group(1)
                 product["review_count"] = match.group(2)
-            else:
-                product["review_rating"] = review_text
-        
-        # レビューリンクからも取得を試みる
-        if not product["review_rating"]:
-            review_link = container.find("a", href=re.compile(r'review\.rakuten\.co\.jp/item'))
-            if review_link:
-                review_text = review_link.get_text(strip=True)
-                match = re.match(r'(\d+\.\d+)\(([\d,]+)件\)', review_text)
-                if match:
-                    product["review_rating"] = match.group(1)
-                    product["review_count"] = match.group(2)
-        
-        # ショップ名を画像URLから抽出
-        shop_match = re.search(r'tshop\.r10s\.jp/([^/]+)/', product["image_url"])
-        if shop_match:
-            product["shop_name"] = shop_match.group(1)
-        
-        # ショップリンクからも取得を試みる
-        if not product["shop_name"]:
-            shop_link = container.find("a", href=re.compile(r'/shop/'))
-            if shop_link:
-                product["shop_name"] = shop_link.get_text(strip=True)
-        
-        # 送料情報を取得
-        shipping_price_patterns = [
-            r'送料\s*([\d,]+円)',
-            r'送料\s*\+?\s*([\d,]+円)',
-            r'送料[：:]\s*([\d,]+円)',
-            r'\+送料\s*([\d,]+円)',
-        ]
-        
-        found_shipping_price = False
-        for pattern in shipping_price_patterns:
-            matches = re.finditer(pattern, container.get_text())
-            for match in matches:
-                full_text = match.group(0)
-                price = match.group(1) if match.groups() else ""
-                
-                if (len(full_text) < 50 and 
-                    "送料" in full_text and 
-                    "円" in full_text and
-                    "送料無料" not in full_text and
-                    price):
-                    product["shipping_price"] = price
-                    product["shipping_info"] = "送料有料"
-                    found_shipping_price = True
-                    break
+    
+    # ショップ名を画像URLから抽出
+    shop_match = re.search(r'tshop\.r10s\.jp/([^/]+)/', product["image_url"])
+    if shop_match:
+        product["shop_name"] = shop_match.group(1)
+    
+    # ショップリンクからも取得を試みる
+    if not product["shop_name"]:
+        shop_link = container.find("a", href=re.compile(r'/shop/'))
+        if shop_link:
+            product["shop_name"] = shop_link.get_text(strip=True)
+    
+    # 送料情報を取得
+    shipping_price_patterns = [
+        r'送料\s*([\d,]+円)',
+        r'送料\s*\+?\s*([\d,]+円)',
+        r'送料[：:]\s*([\d,]+円)',
+        r'\+送料\s*([\d,]+円)',
+    ]
+    
+    found_shipping_price = False
+    for pattern in shipping_price_patterns:
+        matches = re.finditer(pattern, container.get_text())
+        for match in matches:
+            full_text = match.group(0)
+            price = match.group(1) if match.groups() else ""
             
-            if found_shipping_price:
+            if (len(full_text) < 50 and 
+                "送料" in full_text and 
+                "円" in full_text and
+                "送料無料" not in full_text and
+                price):
+                product["shipping_price"] = price
+                product["shipping_info"] = "送料有料"
+                found_shipping_price = True
                 break
         
-        # 送料金額が見つからなかった場合、送料無料/有料の判定のみ
-        if not found_shipping_price:
-            shipping_text_nodes = container.find_all(string=re.compile(r'送料無料|送料有料'))
-            for shipping_node in shipping_text_nodes:
-                shipping_text = shipping_node.strip()
-                if len(shipping_text) < 50 and re.match(r'^送料(無料|有料)', shipping_text):
-                    product["shipping_info"] = shipping_text
-                    break
+        if found_shipping_price:
+            break
+    
+    # 送料金額が見つからなかった場合、送料無料/有料の判定のみ
+    if not found_shipping_price:
+        shipping_text_nodes = container.find_all(string=re.compile(r'送料無料|送料有料'))
+        for shipping_node in shipping_text_nodes:
+            shipping_text = shipping_node.strip()
+            if len(shipping_text) < 50 and re.match(r'^送料(無料|有料)', shipping_text):
+                product["shipping_info"] = shipping_text
+                break
+    
+    # ポイント情報を取得
+    point_text_nodes = container.find_all(string=re.compile(r'ポイント|pt|PT'))
+    if point_text_nodes:
+        point_text = point_text_nodes[0].strip()
+        if len(point_text) < 50:
+            product["point_info"] = point_text
+    
+    # 商品名が取得できた場合のみ返す
+    if not product["name"]:
+        return None
+    return product
+
+
+# 低メモリ抽出モード（環境変数 SCRAPER_LOW_MEMORY=1 で有効化）
+LOW_MEMORY_EXTRACTION = os.getenv('SCRAPER_LOW_MEMORY', '').lower() in ('1', 'true', 'yes')
+
+PRODUCT_IMAGE_PATTERN = re.compile(r'tshop\.r10s\.jp.*\.(jpg|jpeg|png)', re.I)
+CONTAINER_CLASS_KEYWORDS = ('item', 'product', 'goods')
+# 終了タグを持たない要素
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+])
+STREAM_CHUNK_SIZE = 64 * 1024
+# これより大きいコンテナを解析する場合は警告する（ページ全体を包むdivが選ばれると
+# 低メモリモードでもページ全体のツリーを作ることになるため）
+LARGE_CONTAINER_WARN_CHARS = 256 * 1024
+
+
+class _ProductContainerParser(HTMLParser):
+    """
+    HTMLを逐次トークン化し、商品コンテナの位置だけを追跡するパーサー
+    
+    ページ全体のツリーは作らず、開いている要素の (タグ名, 開始位置, class) だけを
+    スタックに保持する。script/style の中身は HTMLParser が CDATA として扱うため
+    タグとして解釈されず、handle_data も無視するので保持しない。
+    商品コンテナが閉じた時点で、その範囲のHTMLだけを BeautifulSoup で解析する。
+    """
+    
+    def __init__(self, html_content: str):
+        super().__init__(convert_charrefs=False)
+        self.html_content = html_content
+        # 各行の開始位置（getposの (行, 列) を文字位置に変換する）
+        self._line_starts = array('q', [0])
+        self._line_starts.extend(m.end() for m in re.finditer('\n', html_content))
+        # [tag, start, is_candidate, selected]  selected = (順番, image_url, image_alt)
+        self._stack = []
+        self._next_seq = 0
+        self._emit_seq = 0
+        self._ready = {}
+    
+    def _offset(self) -> int:
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'img':
+            self._handle_image(dict(attrs))
+            return
+        if tag in VOID_ELEMENTS:
+            return
+        is_candidate = False
+        if tag == 'div':
+            classes = (dict(attrs).get('class') or '').lower().split()
+            is_candidate = any(keyword in cls for cls in classes for keyword in CONTAINER_CLASS_KEYWORDS)
+        self._stack.append([tag, self._offset(), is_candidate, None])
+    
+    def handle_startendtag(self, tag, attrs):
+        if tag == 'img':
+            self._handle_image(dict(attrs))
+    
+    def handle_endtag(self, tag):
+        # 対応する開始タグまで閉じる（閉じ忘れのタグも一緒に閉じる）
+        if not any(entry[0] == tag for entry in self._stack):
+            return
+        start = self._offset()
+        end = self.html_content.find('>', start)
+        end = len(self.html_content) if end < 0 else end + 1
+        while self._stack:
+            entry = self._stack.pop()
+            if entry[3] is not None:
+                self._finish(entry, end)
+            if entry[0] == tag:
+                break
+    
+    def _handle_image(self, attrs: Dict) -> None:
+        src = attrs.get('src') or ''
+        if not PRODUCT_IMAGE_PATTERN.search(src):
+            return
         
-        # ポイント情報を取得
-        point_text_nodes = container.find_all(string=re.compile(r'ポイント|pt|PT'))
-        if point_text_nodes:
-            point_text = point_text_nodes[0].strip()
-            if len(point_text) < 50:
-                product["point_info"] = point_text
+        # 親要素を探索（最大5階層まで）し、見つからなければ最も近いdivを使用
+        container = None
+        for entry in reversed(self._stack[-5:]):
+            if entry[0] == 'div' and entry[2]:
+                container = entry
+                break
+        if container is None:
+            container = next((entry for entry in reversed(self._stack) if entry[0] == 'div'), None)
         
-        # 商品名が取得できた場合のみリストに追加
-        if product["name"]:
-            products.append(product)
+        # 同じコンテナを重複処理しないようにする
+        if container is None or container[3] is not None:
+            return
+        container[3] = (self._next_seq, src, attrs.get('alt') or '')
+        self._next_seq += 1
     
-    return products
+    def _finish(self, entry, end: int) -> None:
+        seq, image_url, image_alt = entry[3]
+        if end - entry[1] > LARGE_CONTAINER_WARN_CHARS:
+            print(f'⚠️ 低メモリモード: 商品コンテナが大きすぎます ({end - entry[1]}文字, <{entry[0]}>)。'
+                  f'item/product/goods クラスのdivが見つからず、外側の要素を解析しています')
+        # コンテナ部分だけの小さなツリーを作り、抽出後は破棄する
+        subtree = BeautifulSoup(self.html_content[entry[1]:end], "html.parser")
+        for node in subtree.find_all(['script', 'style']):
+            node.decompose()
+        container = subtree.find(entry[0])
+        self._ready[seq] = _extract_from_container(container, image_url, image_alt) if container else None
+        subtree.decompose()
+    
+    def close_all(self) -> None:
+        """閉じられていない要素をページ末尾で閉じる"""
+        self.close()
+        while self._stack:
+            entry = self._stack.pop()
+            if entry[3] is not None:
+                self._finish(entry, len(self.html_content))
+    
+    def pop_ready(self) -> Iterator[Dict]:
+        """抽出済みの商品を画像の出現順に取り出す（入れ子のコンテナでも順位を保つ）"""
+        while self._emit_seq in self._ready:
+            product = self._ready.pop(self._emit_seq)
+            self._emit_seq += 1
+            if product:
+                yield product
+
+
+def iter_product_info_low_memory(html_content: str) -> Iterator[Dict]:
+    """
+    HTMLコンテンツから商品情報を低メモリで逐次抽出する
+    
+    ページ全体のツリーを作らず、商品コンテナごとに小さなツリーを作って
+    抽出後すぐに破棄する。script/style の内容は読み飛ばすため、
+    商品コンテナ内のスクリプトのテキストから価格・送料・ポイントを拾う
+    extract_product_info とは結果が異なる場合がある。それ以外は同じ結果になる。
+    
+    Args:
+        html_content: HTMLコンテンツの文字列
+        
+    Yields:
+        商品情報
+    """
+    parser = _ProductContainerParser(html_content)
+    for start in range(0, len(html_content), STREAM_CHUNK_SIZE):
+        parser.feed(html_content[start:start + STREAM_CHUNK_SIZE])
+        yield from parser.pop_ready()
+    parser.close_all()
+    yield from parser.pop_ready()
 
 
 def fetch_rakuten_products(keyword: str, page: int = 1, max_items: int = 30) -> List[Dict]:
@@ -272,6 +443,10 @@ def fetch_rakuten_products(keyword: str, page: int = 1, max_items: int = 30) ->
         response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
         
+        if LOW_MEMORY_EXTRACTION:
+            # 必要な件数を抽出した時点で打ち切る
+            return list(islice(iter_product_info_low_memory(response.text), max_items))
+        
         products = extract_product_info(response.text)
         return products[:max_items]
     except requests.RequestException as e:
@@ -279,13 +454,133 @@ def fetch_rakuten_products(keyword: str, page: int = 1, max_items: int = 30) ->
         return []
 
 
-def write_products_to_sheet(spreadsheet_id: str, products: List[Dict]) -> Dict:
+# スプレッドシートの書き込み範囲（B列〜O列、300行目まで）
+SHEET_HEADERS = [
+    '検索順位',
+    '商品名',
+    '価格(送料抜)',
+    '価格(送料込)',
+    '商品URL',
+    'サムネURL',
+    'レビュー数',
+    'レビュー平均',
+    'レビュー最新日',
+    '直近3ヶ月のレビュー数',
+    '直近3ヶ月のレビュー平均',
+    '高評価レビュー',
+    '中評価レビュー',
+    '低評価レビュー'
+]
+SHEET_LAST_ROW = 300
+
+# ウォーム起動間で再利用する書き込みスケジューラー
+_sheets_scheduler = None
+
+
+def _get_sheets_scheduler() -> SheetsWriteScheduler:
+    """
+    Google Sheets 書き込みスケジューラーを取得する（初回のみ認証して作成）
+    
+    Returns:
+        SheetsWriteScheduler
+    """
+    global _sheets_scheduler
+    if _sheets_scheduler is not None:
+        return _sheets_scheduler
+    
+    # Google Sheets API認証情報を環境変数から取得
+    creds_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
+    if not creds_json:
+        raise ValueError("GOOGLE_SHEETS_CREDENTIALS環境変数が設定されていません")
+    
+    # 認証情報をパース
+    creds_dict = json.loads(creds_json)
+    creds = Credentials.from_service_account_info(
+        creds_dict,
+        scopes=['https://www.googleapis.com/auth/spreadsheets']
+    )
+    
+    gc = gspread.authorize(creds)
+    _sheets_scheduler = SheetsWriteScheduler(GspreadSheetsService(gc))
+    return _sheets_scheduler
+
+
+def build_sheet_rows(products: List[Dict]) -> List[List]:
+    """
+    商品情報をスプレッドシートの行データ（ヘッダー含む）に変換する
+    
+    既存データのクリアも同じ batchUpdate で行うため、
+    SHEET_LAST_ROW 行目までを空文字で埋める
+    
+    Args:
+        products: 商品情報のリスト
+        
+    Returns:
+        B1から始まる行データ
+    """
+    rows = [list(SHEET_HEADERS)]
+    for i, product in enumerate(products):
+        # 価格から数値を抽出
+        price_match = re.search(r'[\d,]+', product.get('price', ''))
+        item_price = int(price_match.group(0).replace(',', '')) if price_match else 0
+        
+        # 送料価格を抽出
+        shipping_price = 0
+        if product.get('shipping_price'):
+            shipping_match = re.search(r'[\d,]+', product['shipping_price'])
+            shipping_price = int(shipping_match.group(0).replace(',', '')) if shipping_match else 0
+        
+        # 送料込み価格を計算
+        total_price = item_price
+        if product.get('shipping_info') == '送料有料' and shipping_price > 0:
+            total_price = item_price + shipping_price
+        elif product.get('shipping_info') == '送料無料':
+            total_price = item_price
+        
+        # レビュー数を数値に変換
+        review_count = int(product.get('review_count', '0').replace(',', '')) if product.get('review_count') else 0
+        
+        # レビュー平均を数値に変換
+        review_average = float(product.get('review_rating', '0')) if product.get('review_rating') else 0.0
+        
+        rows.append([
+            i + 1,  # 検索順位
+            product.get('name', ''),
+            item_price,  # 価格(送料抜)
+            total_price,  # 価格(送料込)
+            product.get('product_url', ''),
+            product.get('image_url', ''),
+            review_count,  # レビュー数
+            review_average,  # レビュー平均
+            '',  # レビュー最新日（後で更新）
+            '',  # 直近3ヶ月のレビュー数（後で更新）
+            '',  # 直近3ヶ月のレビュー平均（後で更新）
+            '',  # 高評価レビュー（後で更新）
+            '',  # 中評価レビュー（後で更新）
+            ''   # 低評価レビュー（後で更新）
+        ])
+    
+    # 既存データのクリア（B2:O300）の代わりに空文字で上書き
+    blank_row = [''] * len(SHEET_HEADERS)
+    while len(rows) < SHEET_LAST_ROW:
+        rows.append(list(blank_row))
+    return rows
+
+
+def write_products_to_sheet(spreadsheet_id: str, products: List[Dict],
+                            sheet_name: Optional[str] = None, flush: bool = True) -> Dict:
     """
     商品情報をGoogle Spreadsheetに書き込む
     
+    書き込みはスケジューラーのキューに追加され、スプレッドシートごとに
+    1回の values.batchUpdate にまとめて送信される
+    
     Args:
         spreadsheet_id: スプレッドシートID
         products: 商品情報のリスト
+        sheet_name: 書き込み先のシート名（省略時は先頭シート）
+        flush: Falseの場合はキューに追加するだけで送信しない（flush_sheet_writesでまとめて送信し、
+               戻り値の "ticket" を wait_sheet_write に渡して結果を受け取る。ticket はJSONに含めないこと）
         
     Returns:
         書き込み結果
@@ -297,101 +592,27 @@ def write_products_to_sheet(spreadsheet_id: str, products: List[Dict]) -> Dict:
         }
     
     try:
-        # Google Sheets API認証情報を環境変数から取得
-        creds_json = os.getenv('GOOGLE_SHEETS_CREDENTIALS')
-        if not creds_json:
-            return {
-                "success": False,
-                "error": "GOOGLE_SHEETS_CREDENTIALS環境変数が設定されていません"
-            }
-        
-        # 認証情報をパース
-        creds_dict = json.loads(creds_json)
-        creds = Credentials.from_service_account_info(
-            creds_dict,
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
-        
-        # スプレッドシートを開く
-        gc = gspread.authorize(creds)
-        ss = gc.open_by_key(spreadsheet_id)
-        sheet = ss.sheet1
-        
-        # 既存のデータをクリア（B2:O300）
-        sheet.batch_clear(['B2:O300'])
+        scheduler = _get_sheets_scheduler()
         
-        # ヘッダーを書き込み
-        headers = [
-            '検索順位',
-            '商品名',
-            '価格(送料抜)',
-            '価格(送料込)',
-            '商品URL',
-            'サムネURL',
-            'レビュー数',
-            'レビュー平均',
-            'レビュー最新日',
-            '直近3ヶ月のレビュー数',
-            '直近3ヶ月のレビュー平均',
-            '高評価レビュー',
-            '中評価レビュー',
-            '低評価レビュー'
-        ]
-        sheet.update('B1:O1', [headers])
-        
-        # 商品データを書き込み
-        row_data = []
-        for i, product in enumerate(products):
-            # 価格から数値を抽出
-            price_match = re.search(r'[\d,]+', product.get('price', ''))
-            item_price = int(price_match.group(0).replace(',', '')) if price_match else 0
-            
-            # 送料価格を抽出
-            shipping_price = 0
-            if product.get('shipping_price'):
-                shipping_match = re.search(r'[\d,]+', product['shipping_price'])
-                shipping_price = int(shipping_match.group(0).replace(',', '')) if shipping_match else 0
-            
-            # 送料込み価格を計算
-            total_price = item_price
-            if product.get('shipping_info') == '送料有料' and shipping_price > 0:
-                total_price = item_price + shipping_price
-            elif product.get('shipping_info') == '送料無料':
-                total_price = item_price
-            
-            # レビュー数を数値に変換
-            review_count = int(product.get('review_count', '0').replace(',', '')) if product.get('review_count') else 0
-            
-            # レビュー平均を数値に変換
-            review_average = float(product.get('review_rating', '0')) if product.get('review_rating') else 0.0
-            
-            row = [
-                i + 1,  # 検索順位
-                product.get('name', ''),
-                item_price,  # 価格(送料抜)
-                total_price,  # 価格(送料込)
-                product.get('product_url', ''),
-                product.get('image_url', ''),
-                review_count,  # レビュー数
-                review_average,  # レビュー平均
-                '',  # レビュー最新日（後で更新）
-                '',  # 直近3ヶ月のレビュー数（後で更新）
-                '',  # 直近3ヶ月のレビュー平均（後で更新）
-                '',  # 高評価レビュー（後で更新）
-                '',  # 中評価レビュー（後で更新）
-                ''   # 低評価レビュー（後で更新）
-            ]
-            row_data.append(row)
+        rows = build_sheet_rows(products)
+        range_name = f'B1:O{len(rows)}'
+        if sheet_name:
+            range_name = f"'{sheet_name}'!{range_name}"
+        ticket = scheduler.enqueue(spreadsheet_id, range_name, rows)
         
-        # 一括書き込み
-        if row_data:
-            sheet.update(f'B2:O{len(row_data) + 1}', row_data)
+        if not flush:
+            return {
+                "success": True,
+                "queued": True,
+                "ticket": ticket,
+                "message": f"{len(products)}件の商品データを書き込みキューに追加しました",
+                "totalProducts": len(products),
+                "metrics": scheduler.metrics()
+            }
         
-        return {
-            "success": True,
-            "message": f"{len(row_data)}件の商品データを書き込みました",
-            "totalProducts": len(row_data)
-        }
+        # 他の呼び出し元が先に flush した場合も、自分の書き込みの結果を待つ
+        scheduler.flush()
+        return wait_sheet_write(ticket, len(products))
         
     except Exception as e:
         return {
@@ -401,6 +622,47 @@ def write_products_to_sheet(spreadsheet_id: str, products: List[Dict]) -> Dict:
         }
 
 
+def flush_sheet_writes() -> Dict[str, Dict]:
+    """
+    キューに溜まった書き込みをまとめて送信する
+    
+    Returns:
+        スプレッドシートIDごとの書き込み結果
+    """
+    if _sheets_scheduler is None:
+        return {}
+    return _sheets_scheduler.flush()
+
+
+def wait_sheet_write(ticket, total_products: int) -> Dict:
+    """
+    キューに追加した書き込みの結果を待つ
+    
+    Args:
+        ticket: write_products_to_sheet(flush=False) が返した "ticket"
+        total_products: 書き込んだ商品数
+        
+    Returns:
+        書き込み結果
+    """
+    scheduler = _sheets_scheduler
+    result = scheduler.wait(ticket)
+    if not result["success"]:
+        return {
+            "success": False,
+            "error": result.get("error", ""),
+            "statusCode": result.get("statusCode"),
+            "message": "書き込みに失敗しました",
+            "metrics": scheduler.metrics()
+        }
+    
+    return {
+        "success": True,
+        "message": f"{total_products}件の商品データを書き込みました",
+        "totalProducts": total_products,
+        "metrics": scheduler.metrics()
+    }
+
 import json
 import urllib.parse
 from http.server import BaseHTTPRequestHandler
@@ -0,0 +1,91 @@
+"""
+負荷テスト・ベンチマーク用の楽天ページのフィクスチャ生成
+
+実際の楽天市場の検索結果ページに近い構造（商品コンテナ、広告、
+インラインスクリプト・スタイル）を持つHTMLを生成する
+"""
+
+import os
+
+
+def build_search_page(num_products: int = 45, num_ads: int = 20, script_kb: int = 200) -> str:
+    """
+    検索結果ページのHTMLを生成する
+
+    Args:
+        num_products: 商品コンテナの数
+        num_ads: 広告ブロックの数
+        script_kb: インラインスクリプト・スタイルの合計サイズ（KB）
+
+    Returns:
+        HTML文字列
+    """
+    parts = ['<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>楽天市場 検索結果</title>']
+
+    # インラインスクリプト・スタイル（商品情報は含まない）
+    chunk = 'var __INITIAL_STATE__ = {"items":[' + ','.join(
+        '{"id":%d,"html":"<div class=\\"item\\">dummy</div>","price":"1,980円"}' % i for i in range(20)
+    ) + ']};\n'
+    script_count = max(1, (script_kb * 1024) // (len(chunk) * 10))
+    for _ in range(script_count):
+        parts.append('<script>' + chunk * 10 + '</script>')
+    parts.append('<style>' + '.searchresultitem .price{color:#bf0000;font-weight:bold}\n' * 200 + '</style>')
+    parts.append('</head><body><div id="root"><div class="searchresults">')
+
+    for i in range(num_products):
+        shop = f'shop{i % 7}'
+        item_url = f'https://item.rakuten.co.jp/{shop}/item{i}/'
+        parts.append(
+            f'<div class="searchresultitem">'
+            f'<div class="image"><a href="{item_url}">'
+            f'<img src="https://tshop.r10s.jp/{shop}/cabinet/img{i}.jpg?fitin=300:300" alt="テスト商品 {i} 詳細説明"></a></div>'
+            f'<div class="content title"><h2 class="title"><a href="{item_url}" title="テスト商品 {i}">テスト商品 {i} 送料無料 まとめ買い</a></h2></div>'
+            f'<div class="content price"><div class="price--OX_YW">{1000 + i * 10:,}円</div></div>'
+            f'<div class="content points"><span>{10 + i}ポイント</span></div>'
+            f'<div class="content shipping"><span>送料無料</span></div>'
+            f'<div class="content review"><a href="https://review.rakuten.co.jp/item/1/{i}_{i}/1.1/">4.{i % 10}{i % 7}({100 + i:,}件)</a></div>'
+            f'<div class="content merchant"><a href="https://www.rakuten.co.jp/{shop}/">{shop}</a></div>'
+            f'<script>window.__rat && window.__rat.push({{"item":{i}}});</script>'
+            f'</div>'
+        )
+        if num_ads and i % max(1, num_products // num_ads) == 0:
+            parts.append(
+                '<div class="ad-block"><iframe src="https://ad.rakuten.co.jp/frame"></iframe>'
+                '<script>' + 'googletag.cmd.push(function(){googletag.display("ad");});' * 20 + '</script>'
+                '<span>PR</span></div>'
+            )
+
+    parts.append('</div></div></body></html>')
+    return ''.join(parts)
+
+
+def build_item_page(size_kb: int = 150) -> str:
+    """
+    商品ページのHTMLを生成する
+
+    Args:
+        size_kb: おおよそのサイズ（KB）
+
+    Returns:
+        HTML文字列
+    """
+    body = '<p>商品説明テキスト。' + 'この商品はテスト用のダミーです。' * 20 + '</p>\n'
+    repeat = max(1, (size_kb * 1024) // len(body.encode('utf-8')))
+    return (
+        '<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>商品ページ</title></head><body>'
+        '<input type="hidden" name="item_id" value="10000001">'
+        + body * repeat +
+        '</body></html>'
+    )
+
+
+def load_fixture(fixture_dir: str, name: str, default: str) -> str:
+    """
+    フィクスチャディレクトリにHTMLファイルがあればそれを使い、なければ生成したHTMLを返す
+    """
+    if fixture_dir:
+        path = os.path.join(fixture_dir, name)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+    return default
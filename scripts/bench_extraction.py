@@ -0,0 +1,184 @@
+"""
+商品情報抽出のベンチマーク
+
+extract_product_info（BeautifulSoupでページ全体を解析）と
+iter_product_info_low_memory（逐次トークン化・コンテナ単位で解析）を
+大きな検索結果ページのフィクスチャで比較し、実行時間とピークRSSを出力する。
+
+RSSを正しく測るため、モード・ページサイズごとに別プロセスで実行する。
+
+使い方:
+    python scripts/bench_extraction.py
+    python scripts/bench_extraction.py --sizes large,huge --repeat 5 --output bench.json
+"""
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+SCRAPER_PATH = os.path.join(ROOT_DIR, 'api', 'rakuten-search-scraper.py')
+
+sys.path.insert(0, SCRIPTS_DIR)
+from _fixtures import build_search_page, load_fixture
+
+# (商品数, 広告数, インラインスクリプトKB)
+PAGE_SIZES = {
+    'small': (45, 20, 200),
+    'large': (45, 100, 3000),
+    'huge': (300, 300, 8000),
+}
+MODES = ('full', 'low_memory')
+
+
+def read_status_kb(field: str) -> int:
+    """/proc/self/status の値（KB）。取得できない場合は0"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def reset_peak_rss() -> bool:
+    """VmHWM（ピークRSS）をリセットする（Linuxのみ）"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class PeakSampler:
+    """clear_refs が使えない環境向けに、RSSを定期的にサンプリングしてピークを記録する"""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, read_status_kb('VmRSS'))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def load_scraper():
+    spec = importlib.util.spec_from_file_location('bench_scraper', SCRAPER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_child(mode: str, size: str, repeat: int, fixture_dir: str) -> dict:
+    """1つのモード・ページサイズを計測する（子プロセス内で実行）"""
+    scraper = load_scraper()
+    extract = {
+        'full': scraper.extract_product_info,
+        'low_memory': lambda html: list(scraper.iter_product_info_low_memory(html)),
+    }[mode]
+
+    html = load_fixture(fixture_dir, f'{size}.html', build_search_page(*PAGE_SIZES.get(size, PAGE_SIZES['large'])))
+
+    # ウォームアップ（正規表現のコンパイル等）。大きなページで行うと解放済みメモリが
+    # プロセスに残りピークRSSが過小になるため、小さなページで行う
+    products = extract(build_search_page(2, 0, 1))
+    del products
+    gc.collect()
+
+    baseline_kb = read_status_kb('VmRSS')
+    hwm_reset = reset_peak_rss()
+    timings = []
+    with PeakSampler() as sampler:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            products = extract(html)
+            timings.append((time.perf_counter() - start) * 1000)
+            count = len(products)
+            del products
+            gc.collect()
+    peak_kb = max(sampler.peak_kb, read_status_kb('VmHWM') if hwm_reset else 0)
+
+    # Pythonヒープのピーク（tracemallocは遅いので別パス）
+    tracemalloc.start()
+    products = extract(html)
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del products
+
+    return {
+        'mode': mode,
+        'size': size,
+        'htmlKb': len(html.encode('utf-8')) // 1024,
+        'products': count,
+        'timeMs': {
+            'median': round(statistics.median(timings), 1),
+            'min': round(min(timings), 1),
+        },
+        'baselineRssKb': baseline_kb,
+        'peakRssKb': peak_kb,
+        'peakRssDeltaKb': max(0, peak_kb - baseline_kb),
+        'heapPeakKb': heap_peak // 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='商品情報抽出のベンチマーク')
+    parser.add_argument('--sizes', default='small,large,huge', help=f'ページサイズ（{", ".join(PAGE_SIZES)}）')
+    parser.add_argument('--modes', default=','.join(MODES), help='抽出モード（full, low_memory）')
+    parser.add_argument('--repeat', type=int, default=3, help='計測回数')
+    parser.add_argument('--fixture-dir', default='', help='<サイズ名>.html を置いたディレクトリ（省略時は生成）')
+    parser.add_argument('--output', default='', help='結果JSONの保存先')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child[0], args.child[1], args.repeat, args.fixture_dir)))
+        return
+
+    results = []
+    print(f"{'size':<8}{'mode':<12}{'html':>8}{'items':>7}{'median':>10}{'peakRSS+':>11}{'heapPeak':>11}")
+    for size in args.sizes.split(','):
+        for mode in args.modes.split(','):
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__),
+                '--child', mode, size,
+                '--repeat', str(args.repeat),
+                '--fixture-dir', args.fixture_dir,
+            ])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            results.append(result)
+            print(f"{size:<8}{mode:<12}{result['htmlKb']:>6}KB{result['products']:>7}"
+                  f"{result['timeMs']['median']:>8}ms{result['peakRssDeltaKb'] / 1024:>9.1f}MB"
+                  f"{result['heapPeakKb'] / 1024:>9.1f}MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'💾 結果を保存しました: {args.output}')
+
+
+if __name__ == '__main__':
+    main()
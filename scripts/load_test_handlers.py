@@ -0,0 +1,413 @@
+"""
+Python ハンドラーの負荷テスト
+
+api/proxy-rakuten.py と api/rakuten-search-scraper.py の handler クラスを
+ローカルのスレッド型HTTPサーバーで起動し、楽天サーバーの代わりに
+フィクスチャHTMLを返すローカルのスタブサーバーに向けて同時リクエストを送る。
+
+スループット・p50/p95/p99 レイテンシ・RSS・オープンソケット数を計測し、
+JSONに保存してバージョン間で比較できるようにする。
+
+使い方:
+    python scripts/load_test_handlers.py --concurrency 1,8,32 --requests 200 --mix proxy=3,scraper=1
+    python scripts/load_test_handlers.py --compare loadtest_results/old.json loadtest_results/new.json
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SCRIPTS_DIR)
+API_DIR = os.path.join(ROOT_DIR, 'api')
+
+sys.path.insert(0, SCRIPTS_DIR)
+from _fixtures import build_item_page, build_search_page, load_fixture
+
+HANDLER_FILES = {
+    'proxy': 'proxy-rakuten.py',
+    'scraper': 'rakuten-search-scraper.py',
+}
+
+
+# ----------------------------------------------------------------------
+# スタブの楽天サーバー
+# ----------------------------------------------------------------------
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """フィクスチャHTMLを返すスタブの楽天サーバー"""
+    protocol_version = 'HTTP/1.1'
+    pages = {}
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        host = self.headers.get('X-Original-Host', '')
+        page = self.pages['search'] if host.startswith('search.') else self.pages['item']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RedirectAdapter(HTTPAdapter):
+    """楽天へのリクエストをスタブサーバーに振り向ける requests のアダプター"""
+
+    def __init__(self, upstream_port: int):
+        super().__init__()
+        self.upstream_port = upstream_port
+
+    def send(self, request, **kwargs):
+        original = urlparse(request.url)
+        request.headers['X-Original-Host'] = original.hostname or ''
+        request.url = original._replace(scheme='http', netloc=f'127.0.0.1:{self.upstream_port}').geturl()
+        return super().send(request, **kwargs)
+
+
+def route_requests_to(upstream_port: int) -> None:
+    """requests.Session（requests.get を含む）の通信をすべてスタブサーバーに送る"""
+    adapter = RedirectAdapter(upstream_port)
+    requests.Session.get_adapter = lambda self, url: adapter
+
+
+# ----------------------------------------------------------------------
+# ハンドラーの起動
+# ----------------------------------------------------------------------
+
+def load_handler(name: str):
+    """api/ 配下のファイル名（ハイフン入り）から handler クラスを読み込む"""
+    path = os.path.join(API_DIR, HANDLER_FILES[name])
+    spec = importlib.util.spec_from_file_location(f'loadtest_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    class QuietHandler(module.handler):
+        def log_message(self, format, *args):
+            pass
+
+    return QuietHandler
+
+
+def start_server(handler_class) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ----------------------------------------------------------------------
+# 計測
+# ----------------------------------------------------------------------
+
+def current_rss_kb() -> int:
+    """現在のRSS（KB）。/proc が無い環境では最大RSSを返す"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def open_socket_count() -> int:
+    """プロセスが開いているソケット数（/proc が無い環境では -1）"""
+    try:
+        fds = os.listdir('/proc/self/fd')
+    except OSError:
+        return -1
+    count = 0
+    for fd in fds:
+        try:
+            if os.readlink(f'/proc/self/fd/{fd}').startswith('socket:'):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+class ResourceSampler:
+    """実行中のRSS・ソケット数のピークを定期的に記録する"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.peak_sockets = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss_kb = max(self.peak_rss_kb, current_rss_kb())
+            self.peak_sockets = max(self.peak_sockets, open_socket_count())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, p: float):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return round(values[index], 1)
+
+
+# ----------------------------------------------------------------------
+# 負荷の生成
+# ----------------------------------------------------------------------
+
+def parse_mix(mix: str):
+    """'proxy=3,scraper=1' を [('proxy', 3), ('scraper', 1)] に変換する"""
+    weights = []
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in HANDLER_FILES:
+            raise ValueError(f'不明なハンドラー: {name}（{", ".join(HANDLER_FILES)}）')
+        weights.append((name, float(weight or 1)))
+    return weights
+
+
+def request_path(name: str, n: int) -> str:
+    if name == 'proxy':
+        return '/api/proxy-rakuten?url=' + quote(f'https://item.rakuten.co.jp/shop{n % 7}/item{n}/', safe='')
+    return f'/api/rakuten-search-scraper?keyword={quote("テスト")}&maxItems=30'
+
+
+def send_one(port: int, path: str, timeout: float):
+    """1リクエストを送り (status, elapsed_ms, body) を返す"""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        body = response.read()
+        status = response.status
+    except Exception:
+        status, body = 0, b''
+    finally:
+        conn.close()
+    return status, (time.perf_counter() - start) * 1000, body
+
+
+def is_success(name: str, status: int, body: bytes) -> bool:
+    """
+    レスポンスが成功かどうかを判定する
+
+    scraper は例外時も HTTP 200 で {"success": false} を返すため、ボディで判定する
+    """
+    if status != 200:
+        return False
+    if name == 'scraper':
+        try:
+            return json.loads(body.decode('utf-8')).get('success') is not False
+        except ValueError:
+            return False
+    return True
+
+
+def run_level(ports, weights, concurrency: int, total: int, timeout: float, seed: int):
+    rng = random.Random(seed)
+    names = [name for name, _ in weights]
+    plan = rng.choices(names, weights=[w for _, w in weights], k=total)
+    # レイテンシは成功したリクエストのみ集計し、失敗は別に記録する
+    samples = {name: [] for name in names}
+    error_samples = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def task(i, name):
+        status, elapsed_ms, body = send_one(ports[name], request_path(name, i), timeout)
+        with lock:
+            if is_success(name, status, body):
+                samples[name].append(elapsed_ms)
+            else:
+                error_samples[name].append(elapsed_ms)
+
+    rss_before = current_rss_kb()
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for i, name in enumerate(plan):
+                executor.submit(task, i, name)
+        wall = time.perf_counter() - start
+
+    all_samples = [ms for values in samples.values() for ms in values]
+    result = {
+        'concurrency': concurrency,
+        'requests': total,
+        'wallSeconds': round(wall, 3),
+        'throughputRps': round(total / wall, 2) if wall else None,
+        'latencyMs': {
+            'p50': percentile(all_samples, 50),
+            'p95': percentile(all_samples, 95),
+            'p99': percentile(all_samples, 99),
+        },
+        'errors': sum(len(values) for values in error_samples.values()),
+        'rssKb': {'before': rss_before, 'peak': sampler.peak_rss_kb, 'after': current_rss_kb()},
+        'peakOpenSockets': sampler.peak_sockets,
+        'handlers': {},
+    }
+    for name in names:
+        result['handlers'][name] = {
+            'requests': len(samples[name]) + len(error_samples[name]),
+            'errors': len(error_samples[name]),
+            'latencyMs': {
+                'p50': percentile(samples[name], 50),
+                'p95': percentile(samples[name], 95),
+                'p99': percentile(samples[name], 99),
+            },
+            'errorLatencyMs': {
+                'p50': percentile(error_samples[name], 50),
+                'p95': percentile(error_samples[name], 95),
+            },
+        }
+    return result
+
+
+# ----------------------------------------------------------------------
+# 保存・比較
+# ----------------------------------------------------------------------
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_level(level):
+    lat = level['latencyMs']
+    print(f"  c={level['concurrency']:>3}  {level['throughputRps']:>8} req/s  "
+          f"p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms  "
+          f"errors={level['errors']}  peakRSS={level['rssKb']['peak'] // 1024}MB  "
+          f"sockets={level['peakOpenSockets']}")
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"📊 {old['revision']} → {new['revision']}")
+    old_levels = {level['concurrency']: level for level in old['levels']}
+    for level in new['levels']:
+        base = old_levels.get(level['concurrency'])
+        if base is None:
+            continue
+
+        def delta(a, b):
+            if not a or b is None:
+                return 'n/a'
+            return f'{(b - a) / a * 100:+.1f}%'
+
+        print(f"  c={level['concurrency']:>3}  "
+              f"throughput {delta(base['throughputRps'], level['throughputRps'])}  "
+              f"p50 {delta(base['latencyMs']['p50'], level['latencyMs']['p50'])}  "
+              f"p95 {delta(base['latencyMs']['p95'], level['latencyMs']['p95'])}  "
+              f"p99 {delta(base['latencyMs']['p99'], level['latencyMs']['p99'])}  "
+              f"peakRSS {delta(base['rssKb']['peak'], level['rssKb']['peak'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Python ハンドラーの負荷テスト')
+    parser.add_argument('--concurrency', default='1,8,32', help='同時接続数（カンマ区切りで複数指定）')
+    parser.add_argument('--requests', type=int, default=200, help='同時接続数ごとのリクエスト数')
+    parser.add_argument('--mix', default='proxy=3,scraper=1', help='リクエストの比率（例: proxy=3,scraper=1）')
+    parser.add_argument('--upstream-latency-ms', type=float, default=50, help='スタブの楽天サーバーの応答遅延')
+    parser.add_argument('--fixture-dir', default='', help='search.html / item.html を置いたディレクトリ（省略時は生成）')
+    parser.add_argument('--timeout', type=float, default=60, help='クライアントのタイムアウト（秒）')
+    parser.add_argument('--handler-log', default=os.devnull, help='ハンドラーの print 出力先')
+    parser.add_argument('--output', default='', help='結果JSONの保存先（省略時は loadtest_results/ に保存）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='保存済みの結果を比較する')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    weights = parse_mix(args.mix)
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    UpstreamHandler.pages = {
+        'search': load_fixture(args.fixture_dir, 'search.html', build_search_page()).encode('utf-8'),
+        'item': load_fixture(args.fixture_dir, 'item.html', build_item_page()).encode('utf-8'),
+    }
+    UpstreamHandler.latency = args.upstream_latency_ms / 1000.0
+    upstream = start_server(UpstreamHandler)
+    route_requests_to(upstream.server_address[1])
+
+    servers = {name: start_server(load_handler(name)) for name, _ in weights}
+    ports = {name: server.server_address[1] for name, server in servers.items()}
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'config': {
+            'mix': args.mix,
+            'requests': args.requests,
+            'upstreamLatencyMs': args.upstream_latency_ms,
+            'fixtureDir': args.fixture_dir,
+        },
+        'levels': [],
+    }
+
+    print(f"🚀 負荷テスト開始 ({report['revision']}): mix={args.mix}, requests={args.requests}")
+    stdout = sys.stdout
+    with open(args.handler_log, 'w', encoding='utf-8') as handler_log:
+        for concurrency in levels:
+            # ハンドラーの print（HTML全文ログなど）は別の出力先へ
+            sys.stdout = handler_log
+            try:
+                level = run_level(ports, weights, concurrency, args.requests, args.timeout, args.seed)
+            finally:
+                sys.stdout = stdout
+            report['levels'].append(level)
+            print_level(level)
+
+    for server in list(servers.values()) + [upstream]:
+        server.shutdown()
+
+    output = args.output or os.path.join(
+        ROOT_DIR, 'loadtest_results', f"{datetime.now():%Y%m%d-%H%M%S}-{report['revision']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'💾 結果を保存しました: {output}')
+
+
+if __name__ == '__main__':
+    main()
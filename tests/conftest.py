@@ -0,0 +1,23 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# api/ 配下の補助モジュール（_sheets_writer など）を import できるようにする
+sys.path.insert(0, os.path.join(ROOT_DIR, 'api'))
+# フィクスチャ生成（scripts/_fixtures.py）
+sys.path.insert(0, os.path.join(ROOT_DIR, 'scripts'))
+
+
+@pytest.fixture(scope='session')
+def scraper():
+    """api/rakuten-search-scraper.py（ファイル名にハイフンを含む）をモジュールとして読み込む"""
+    pytest.importorskip('bs4')
+    path = os.path.join(ROOT_DIR, 'api', 'rakuten-search-scraper.py')
+    spec = importlib.util.spec_from_file_location('rakuten_search_scraper', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,243 @@
+"""CrawlScheduler / detect_block_page のテスト（偽の fetch を使用）"""
+
+import threading
+
+from _crawl_scheduler import (
+    PRIORITY_ITEM,
+    PRIORITY_REVIEW,
+    PRIORITY_SEARCH,
+    CrawlScheduler,
+    HostPoliteness,
+    classify_url,
+    detect_block_page,
+)
+
+SEARCH_URL = 'https://search.rakuten.co.jp/search/mall/test/'
+NORMAL_HTML = '<html><head><title>楽天市場</title></head><body>' + '<div>商品</div>' * 50 + '</body></html>'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeFetch:
+    """URLごとに決めたレスポンスを返し、取得順を記録する偽の fetch"""
+
+    def __init__(self, responses=None):
+        self.responses = responses or {}
+        self.order = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        with self._lock:
+            self.order.append(url)
+        return self.responses.get(url, (200, NORMAL_HTML))
+
+
+def make_result(url, reason=None, blocked=None):
+    return {
+        'url': url,
+        'status_code': 200,
+        'html': '',
+        'blocked': reason is not None if blocked is None else blocked,
+        'reason': reason,
+        'elapsed_ms': 0,
+    }
+
+
+# ----------------------------------------------------------------------
+# detect_block_page
+# ----------------------------------------------------------------------
+
+def test_detect_block_page_status_and_short_html():
+    assert detect_block_page(NORMAL_HTML, 403) == 'status_403'
+    assert detect_block_page(NORMAL_HTML, 429) == 'status_429'
+    assert detect_block_page('<html></html>') == 'too_short'
+    assert detect_block_page('An error occurred. Reference #12.abc') == 'error_reference'
+    assert detect_block_page(NORMAL_HTML) is None
+
+
+def test_detect_block_page_captcha_pages():
+    title_page = '<html><head><title>Access Denied</title></head><body>' + 'x' * 200 + '</body></html>'
+    widget_page = '<html><body><div class="g-recaptcha" data-sitekey="k"></div>' + 'x' * 200 + '</body></html>'
+    japanese_page = '<html><head><title>アクセスが集中しています</title></head><body>' + 'x' * 200 + '</body></html>'
+    assert detect_block_page(title_page) == 'captcha'
+    assert detect_block_page(widget_page) == 'captcha'
+    assert detect_block_page(japanese_page) == 'captcha'
+
+
+def test_detect_block_page_ignores_marker_words_in_body():
+    # 本文中に "captcha" や "access denied" を含むだけの正常な小さいページ
+    page = (
+        '<html><head><title>よくある質問</title></head><body>'
+        '<p>captcha の入力を求められた場合や access denied と表示された場合は</p>'
+        '<p>アクセスが集中している可能性があります。</p>' + 'x' * 200 +
+        '</body></html>'
+    )
+    assert detect_block_page(page) is None
+
+
+def test_detect_block_page_ignores_large_pages():
+    page = '<html><head><title>Access Denied</title></head><body>' + 'x' * 30000 + '</body></html>'
+    assert detect_block_page(page) is None
+
+
+def test_classify_url():
+    assert classify_url(SEARCH_URL) == PRIORITY_SEARCH
+    assert classify_url('https://item.rakuten.co.jp/shop/item1/') == PRIORITY_ITEM
+    assert classify_url('https://review.rakuten.co.jp/item/1/1_1/1.1/') == PRIORITY_REVIEW
+
+
+# ----------------------------------------------------------------------
+# CrawlScheduler
+# ----------------------------------------------------------------------
+
+def test_fetches_in_priority_order():
+    fetch = FakeFetch()
+    scheduler = CrawlScheduler(fetch, min_host_interval=0, initial_concurrency=1, max_concurrency=1)
+
+    urls = [
+        'https://review.rakuten.co.jp/item/1/1_1/1.1/',
+        'https://item.rakuten.co.jp/shop/item1/',
+        SEARCH_URL,
+        'https://item.rakuten.co.jp/shop/item2/',
+    ]
+    for url in urls:
+        scheduler.add(url)
+    # 追加済みのURLは無視する
+    assert scheduler.add(SEARCH_URL) is False
+
+    results = scheduler.run()
+
+    assert fetch.order == [urls[2], urls[1], urls[3], urls[0]]
+    assert len(results) == 4
+    assert scheduler.stats['succeeded'] == 4
+
+
+def test_on_result_adds_discovered_urls():
+    fetch = FakeFetch()
+    scheduler = CrawlScheduler(fetch, min_host_interval=0, initial_concurrency=2, max_concurrency=2)
+    scheduler.add(SEARCH_URL)
+
+    def on_result(result):
+        if result['url'] == SEARCH_URL:
+            return [f'https://item.rakuten.co.jp/shop/item{i}/' for i in range(3)]
+        return None
+
+    results = scheduler.run(on_result)
+
+    assert fetch.order[0] == SEARCH_URL
+    assert sorted(r['url'] for r in results) == sorted(
+        [SEARCH_URL] + [f'https://item.rakuten.co.jp/shop/item{i}/' for i in range(3)]
+    )
+
+
+def test_blocked_url_is_requeued_up_to_max_retries():
+    blocked_url = 'https://item.rakuten.co.jp/shop/blocked/'
+    fetch = FakeFetch({blocked_url: (403, NORMAL_HTML)})
+    scheduler = CrawlScheduler(fetch, min_host_interval=0, initial_concurrency=1, max_concurrency=1, max_retries=2)
+    scheduler.add(blocked_url)
+
+    results = scheduler.run()
+
+    assert fetch.order == [blocked_url] * 3
+    assert scheduler.stats['blocked'] == 3
+    assert scheduler.stats['retried'] == 2
+    assert scheduler.stats['dropped'] == 1
+    assert results == [dict(results[0], blocked=True, reason='status_403')]
+
+
+def test_blocked_url_succeeds_on_retry():
+    url = 'https://item.rakuten.co.jp/shop/flaky/'
+    responses = [(429, ''), (200, NORMAL_HTML)]
+
+    def fetch(requested):
+        return responses.pop(0)
+
+    scheduler = CrawlScheduler(fetch, min_host_interval=0, initial_concurrency=1, max_concurrency=1)
+    scheduler.add(url)
+    results = scheduler.run()
+
+    assert [r['reason'] for r in results] == [None]
+    assert scheduler.stats['retried'] == 1
+
+
+def test_concurrency_halves_when_block_rate_rises():
+    scheduler = CrawlScheduler(FakeFetch(), initial_concurrency=8, max_concurrency=8, window_size=4,
+                               block_rate_high=0.2, max_retries=0)
+
+    scheduler._record('https://item.rakuten.co.jp/a/', PRIORITY_ITEM, 0, make_result('a', 'status_403'))
+    assert scheduler.concurrency == 4
+    scheduler._record('https://item.rakuten.co.jp/b/', PRIORITY_ITEM, 0, make_result('b', 'captcha'))
+    assert scheduler.concurrency == 2
+    scheduler._record('https://item.rakuten.co.jp/c/', PRIORITY_ITEM, 0, make_result('c', 'captcha'))
+    assert scheduler.concurrency == 1
+    # min_concurrency より下げない
+    scheduler._record('https://item.rakuten.co.jp/d/', PRIORITY_ITEM, 0, make_result('d', 'captcha'))
+    assert scheduler.concurrency == 1
+    assert scheduler.stats['concurrency_changes'] == 3
+
+
+def test_concurrency_recovers_when_block_rate_falls():
+    scheduler = CrawlScheduler(FakeFetch(), initial_concurrency=1, max_concurrency=3, window_size=4)
+
+    for i in range(20):
+        scheduler._record(f'https://item.rakuten.co.jp/{i}/', PRIORITY_ITEM, 0, make_result(str(i)))
+
+    # ウィンドウの半分の成功ごとに1ずつ増え、max_concurrency で止まる
+    assert scheduler.concurrency == 3
+    assert scheduler.stats['concurrency_changes'] == 2
+
+
+def test_errors_are_not_counted_as_blocks():
+    scheduler = CrawlScheduler(FakeFetch(), initial_concurrency=4, max_concurrency=4, window_size=4, max_retries=0)
+
+    for i in range(4):
+        scheduler._record(f'https://item.rakuten.co.jp/{i}/', PRIORITY_ITEM, 0,
+                          make_result(str(i), 'error', blocked=False))
+
+    assert scheduler.concurrency == 4
+    assert scheduler.stats['errors'] == 4
+    assert scheduler.stats['blocked'] == 0
+
+
+# ----------------------------------------------------------------------
+# HostPoliteness
+# ----------------------------------------------------------------------
+
+def test_host_politeness_enforces_interval_per_host():
+    clock = FakeClock()
+    politeness = HostPoliteness(min_interval=1.0, clock=clock)
+
+    assert politeness.try_acquire('item.rakuten.co.jp') is True
+    assert politeness.try_acquire('item.rakuten.co.jp') is False
+    assert politeness.delay('item.rakuten.co.jp') == 1.0
+    # 別ホストは独立
+    assert politeness.try_acquire('review.rakuten.co.jp') is True
+
+    clock.now += 1.0
+    assert politeness.try_acquire('item.rakuten.co.jp') is True
+
+
+def test_host_politeness_penalize_and_relax():
+    clock = FakeClock()
+    politeness = HostPoliteness(min_interval=1.0, max_interval=4.0, clock=clock)
+    host = 'item.rakuten.co.jp'
+
+    politeness.penalize(host)
+    assert politeness.interval(host) == 2.0
+    assert politeness.delay(host) == 2.0
+    politeness.penalize(host)
+    politeness.penalize(host)
+    # max_interval で頭打ち
+    assert politeness.interval(host) == 4.0
+
+    politeness.relax(host)
+    assert politeness.interval(host) == 3.6
+    for _ in range(20):
+        politeness.relax(host)
+    assert politeness.interval(host) == 1.0
@@ -0,0 +1,130 @@
+"""低メモリ抽出モード（iter_product_info_low_memory）のテスト"""
+
+from _fixtures import build_search_page
+
+IMG = '<img src="https://tshop.r10s.jp/{shop}/cabinet/{name}.jpg" alt="{alt}">'
+
+
+def product_div(i, cls='searchresultitem', extra=''):
+    shop = f'shop{i}'
+    return (
+        f'<div class="{cls}">'
+        + IMG.format(shop=shop, name=f'img{i}', alt=f'商品{i}') +
+        f'<h2><a href="https://item.rakuten.co.jp/{shop}/item{i}/">商品 {i}</a></h2>'
+        f'<div class="price">{1000 + i:,}円</div>'
+        f'<span>送料無料</span>{extra}'
+        f'</div>'
+    )
+
+
+def assert_same(scraper, html):
+    expected = scraper.extract_product_info(html)
+    actual = list(scraper.iter_product_info_low_memory(html))
+    assert actual == expected
+    return actual
+
+
+def test_matches_full_mode_on_fixture_page(scraper):
+    products = assert_same(scraper, build_search_page())
+    assert len(products) == 45
+
+
+def test_matches_full_mode_on_page_larger_than_chunk(scraper):
+    html = build_search_page(num_products=120, num_ads=40, script_kb=600)
+    assert len(html) > scraper.STREAM_CHUNK_SIZE * 5
+    products = assert_same(scraper, html)
+    assert len(products) == 120
+
+
+def test_crlf_multiline_page_larger_than_chunk(scraper):
+    # 行・列から文字位置への変換を、CRLF改行の多い複数チャンクのページで確認する
+    html = build_search_page(num_products=60, num_ads=20, script_kb=200).replace('><', '>\r\n  <')
+    assert len(html) > scraper.STREAM_CHUNK_SIZE * 2
+    assert html.count('\r\n') > 1000
+    products = assert_same(scraper, html)
+    assert len(products) == 60
+
+
+def test_nested_containers_keep_image_order(scraper):
+    inner = product_div(2, cls='item-inner')
+    outer = (
+        '<div class="item-outer">'
+        + IMG.format(shop='shop1', name='img1', alt='外側') +
+        '<h2><a href="https://item.rakuten.co.jp/shop1/item1/">外側の商品</a></h2>'
+        + inner +
+        '</div>'
+    )
+    html = f'<html><body>{product_div(0)}{outer}{product_div(3)}</body></html>'
+
+    products = assert_same(scraper, html)
+
+    # 内側のコンテナが先に閉じても、画像の出現順で返す
+    assert [p['name'] for p in products] == ['商品 0', '外側の商品', '商品 2', '商品 3']
+
+
+def test_unclosed_p_inside_container(scraper):
+    html = (
+        '<html><body>'
+        + product_div(0, extra='<p>説明文<p>もう一つの段落')
+        + product_div(1, extra='<p>閉じていない段落')
+        + '</body></html>'
+    )
+    products = assert_same(scraper, html)
+    assert len(products) == 2
+
+
+def test_stray_closing_div(scraper):
+    html = '<html><body></div>' + product_div(0) + '</div></div>' + product_div(1) + '</body></html>'
+    products = assert_same(scraper, html)
+    assert [p['name'] for p in products] == ['商品 0', '商品 1']
+
+
+def test_unclosed_container_at_end_of_page(scraper):
+    html = '<html><body>' + product_div(0) + product_div(1)[:-len('</div>')]
+    products = assert_same(scraper, html)
+    assert len(products) == 2
+
+
+def test_image_without_item_class_ancestor_uses_nearest_div(scraper):
+    html = (
+        '<html><body><div class="wrapper"><div class="card">'
+        + IMG.format(shop='shopx', name='imgx', alt='フォールバック商品') +
+        '<div class="price">2,500円</div>'
+        '</div></div></body></html>'
+    )
+    products = assert_same(scraper, html)
+    assert products[0]['name'] == 'フォールバック商品'
+    assert products[0]['price'] == '2,500円'
+
+
+def test_large_fallback_container_logs_warning(scraper, capsys):
+    # item クラスのdivが無く、ページ全体を包むdivがコンテナになる場合
+    filler = '<p>' + 'テキスト' * 100 + '</p>'
+    html = (
+        '<html><body><div id="root">'
+        + IMG.format(shop='shopx', name='imgx', alt='ページ全体') +
+        filler * (scraper.LARGE_CONTAINER_WARN_CHARS // len(filler) + 1) +
+        '</div></body></html>'
+    )
+    products = list(scraper.iter_product_info_low_memory(html))
+
+    assert [p['name'] for p in products] == ['ページ全体']
+    assert '商品コンテナが大きすぎます' in capsys.readouterr().out
+
+
+def test_price_only_inside_script_differs_from_full_mode(scraper):
+    # 低メモリモードはコンテナ内の <script> のテキストを読まない（ドキュメント記載の差異）
+    html = (
+        '<html><body><div class="item">'
+        + IMG.format(shop='shop1', name='img1', alt='商品') +
+        '<h2><a href="https://item.rakuten.co.jp/shop1/item1/">スクリプト価格の商品</a></h2>'
+        '<script>var x="送料 500円"; var pt=1;</script>'
+        '</div></body></html>'
+    )
+    full = scraper.extract_product_info(html)[0]
+    low = list(scraper.iter_product_info_low_memory(html))[0]
+
+    assert full['price'] == '500円'
+    assert low['price'] == ''
+    assert low['point_info'] == ''
+    assert low['name'] == full['name']
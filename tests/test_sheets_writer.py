@@ -0,0 +1,317 @@
+"""SheetsWriteScheduler のテスト（ローカルの偽 Sheets サービスを使用）"""
+
+import threading
+
+from _sheets_writer import SheetsWriteScheduler
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    """gspread.exceptions.APIError と同じく response.status_code を持つ例外"""
+
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.response = FakeResponse(status_code)
+
+
+class FakeSheetsService:
+    """values_batch_update の呼び出しを記録し、指定した順にエラーを返す偽サービス"""
+
+    def __init__(self, errors=None):
+        self.calls = []
+        self.errors = list(errors or [])
+
+    def values_batch_update(self, spreadsheet_id, body):
+        self.calls.append((spreadsheet_id, body))
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'spreadsheetId': spreadsheet_id}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_scheduler(service, clock, **kwargs):
+    kwargs.setdefault('rand', lambda: 0.5)
+    return SheetsWriteScheduler(service, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_merges_keywords_into_one_call_per_spreadsheet():
+    service = FakeSheetsService()
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock)
+
+    for keyword in ['a', 'b', 'c']:
+        scheduler.enqueue('sheet-1', f"'{keyword}'!B1:O300", [[keyword]])
+    scheduler.enqueue('sheet-2', 'B1:O300', [['x']])
+    assert scheduler.queue_depth() == 4
+
+    results = scheduler.flush()
+
+    assert [spreadsheet_id for spreadsheet_id, _ in service.calls] == ['sheet-1', 'sheet-2']
+    assert [d['range'] for d in service.calls[0][1]['data']] == ["'a'!B1:O300", "'b'!B1:O300", "'c'!B1:O300"]
+    assert service.calls[0][1]['valueInputOption'] == 'RAW'
+    assert results == {
+        'sheet-1': {'success': True, 'ranges': 3, 'calls': 1},
+        'sheet-2': {'success': True, 'ranges': 1, 'calls': 1},
+    }
+    assert scheduler.queue_depth() == 0
+
+
+def test_same_range_is_last_write_wins():
+    service = FakeSheetsService()
+    scheduler = make_scheduler(service, FakeClock())
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['old']])
+    scheduler.enqueue('sheet-1', 'B1:O300', [['new']])
+    scheduler.flush()
+
+    data = service.calls[0][1]['data']
+    assert data == [{'range': 'B1:O300', 'values': [['new']]}]
+    assert scheduler.stats['merged'] == 1
+
+
+def test_max_ranges_per_call_splits_batches():
+    service = FakeSheetsService()
+    scheduler = make_scheduler(service, FakeClock(), max_ranges_per_call=2)
+
+    for i in range(5):
+        scheduler.enqueue('sheet-1', f"'k{i}'!B1:O300", [[i]])
+    results = scheduler.flush()
+
+    assert [len(body['data']) for _, body in service.calls] == [2, 2, 1]
+    assert results['sheet-1']['calls'] == 3
+
+
+def test_retries_429_with_jittered_backoff():
+    service = FakeSheetsService(errors=[FakeAPIError(429), FakeAPIError(429)])
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock, base_backoff=1.0, rand=lambda: 0.25)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    results = scheduler.flush()
+
+    assert results['sheet-1']['success'] is True
+    assert len(service.calls) == 3
+    # フルジッター: base * 2^attempt * rand
+    assert clock.sleeps == [0.25, 0.5]
+    assert scheduler.stats['retries'] == 2
+    assert scheduler.stats['rate_limited'] == 2
+
+
+def test_gives_up_after_max_retries():
+    service = FakeSheetsService(errors=[FakeAPIError(429)] * 10)
+    scheduler = make_scheduler(service, FakeClock(), max_retries=3)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    results = scheduler.flush()
+
+    assert len(service.calls) == 4
+    assert results['sheet-1']['success'] is False
+    assert results['sheet-1']['statusCode'] == 429
+    assert scheduler.stats['failures'] == 1
+
+
+def test_non_retryable_error_fails_immediately():
+    service = FakeSheetsService(errors=[FakeAPIError(400)])
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    scheduler.enqueue('sheet-2', 'B1:O300', [['y']])
+    results = scheduler.flush()
+
+    assert results['sheet-1']['success'] is False
+    assert results['sheet-1']['statusCode'] == 400
+    assert clock.sleeps == []
+    # 他のスプレッドシートの書き込みは続行する
+    assert results['sheet-2']['success'] is True
+
+
+def test_quota_throttles_until_window_frees():
+    service = FakeSheetsService()
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock, writes_per_minute=2, deadline_seconds=120)
+
+    for i in range(3):
+        scheduler.enqueue(f'sheet-{i}', 'B1:O300', [[i]])
+    results = scheduler.flush()
+
+    assert all(result['success'] for result in results.values())
+    assert clock.sleeps == [60.0]
+    assert scheduler.stats['throttle_seconds'] == 60.0
+    assert scheduler.quota_used() == 1
+
+
+def test_quota_wait_past_deadline_fails_without_sleeping():
+    service = FakeSheetsService()
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock, writes_per_minute=1, deadline_seconds=10)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    scheduler.enqueue('sheet-2', 'B1:O300', [['y']])
+    results = scheduler.flush()
+
+    assert results['sheet-1']['success'] is True
+    assert results['sheet-2']['success'] is False
+    assert results['sheet-2']['statusCode'] == 429
+    assert clock.sleeps == []
+
+
+def test_backoff_past_deadline_fails_without_sleeping():
+    service = FakeSheetsService(errors=[FakeAPIError(503)] * 10)
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock, base_backoff=4.0, rand=lambda: 1.0, deadline_seconds=10)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    results = scheduler.flush()
+
+    # 4秒 → 8秒（合計12秒で期限超過）なので2回目の待機は行わない
+    assert clock.sleeps == [4.0]
+    assert results['sheet-1']['success'] is False
+    assert results['sheet-1']['statusCode'] == 503
+    assert sum(clock.sleeps) <= 10
+
+
+def test_metrics_reports_queue_depth_and_latency():
+    service = FakeSheetsService()
+    clock = FakeClock()
+    scheduler = make_scheduler(service, clock)
+
+    scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+    clock.now = 0.2
+    scheduler.enqueue('sheet-2', 'B1:O300', [['y']])
+    assert scheduler.metrics()['queueDepth'] == 2
+
+    clock.now = 0.5
+    scheduler.flush()
+    metrics = scheduler.metrics()
+
+    assert metrics['queueDepth'] == 0
+    assert metrics['quotaUsedPerMinute'] == 2
+    assert metrics['quotaLimitPerMinute'] == 60
+    assert metrics['latencyMs'] == {'p50': 300.0, 'p95': 500.0, 'max': 500.0}
+    assert metrics['calls'] == 2
+    assert metrics['ranges_written'] == 2
+
+
+
+def test_merged_writes_resolve_every_caller():
+    service = FakeSheetsService()
+    scheduler = make_scheduler(service, FakeClock())
+
+    old = scheduler.enqueue('sheet-1', 'B1:O300', [['old']])
+    new = scheduler.enqueue('sheet-1', 'B1:O300', [['new']])
+    scheduler.flush()
+
+    assert old.result(timeout=0) == {'success': True}
+    assert new.result(timeout=0) == {'success': True}
+
+
+def test_failure_reaches_caller_whose_write_was_flushed_by_another_caller():
+    # sheet-1 への書き込みは 400 で失敗する
+    class FailingSheetOne(FakeSheetsService):
+        def values_batch_update(self, spreadsheet_id, body):
+            if spreadsheet_id == 'sheet-1':
+                self.calls.append((spreadsheet_id, body))
+                raise FakeAPIError(400)
+            return super().values_batch_update(spreadsheet_id, body)
+
+    scheduler = make_scheduler(FailingSheetOne(), FakeClock())
+
+    ticket_a = scheduler.enqueue('sheet-1', 'B1:O300', [['a']])
+    ticket_b = scheduler.enqueue('sheet-2', 'B1:O300', [['b']])
+    # 呼び出し元Bが先に flush し、Aの書き込みも一緒に送信される
+    scheduler.flush()
+
+    # 呼び出し元Aの flush には何も残っていないが、結果は失敗として受け取れる
+    assert scheduler.flush() == {}
+    assert scheduler.wait(ticket_a) == {'success': False, 'error': 'HTTP 400', 'statusCode': 400}
+    assert scheduler.wait(ticket_b) == {'success': True}
+
+
+def test_failure_reaches_callers_in_unsent_chunks():
+    service = FakeSheetsService(errors=[FakeAPIError(400)])
+    scheduler = make_scheduler(service, FakeClock(), max_ranges_per_call=1)
+
+    first = scheduler.enqueue('sheet-1', "'a'!B1:O300", [['a']])
+    second = scheduler.enqueue('sheet-1', "'b'!B1:O300", [['b']])
+    scheduler.flush()
+
+    assert len(service.calls) == 1
+    assert first.result(timeout=0)['success'] is False
+    assert second.result(timeout=0)['success'] is False
+    assert second.result(timeout=0)['statusCode'] == 400
+
+
+def test_wait_receives_result_of_concurrent_flush():
+    release = threading.Event()
+    sending = threading.Event()
+
+    class BlockingService(FakeSheetsService):
+        def values_batch_update(self, spreadsheet_id, body):
+            sending.set()
+            release.wait(timeout=5)
+            return super().values_batch_update(spreadsheet_id, body)
+
+    scheduler = make_scheduler(BlockingService(), FakeClock())
+    ticket = scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+
+    other = threading.Thread(target=scheduler.flush)
+    other.start()
+    assert sending.wait(timeout=5)
+
+    # 別スレッドが送信中なので、この flush は何も送らず、結果もまだ出ていない
+    assert scheduler.flush() == {}
+    assert not ticket.done()
+
+    release.set()
+    assert scheduler.wait(ticket, timeout=5) == {'success': True}
+    other.join(timeout=5)
+
+
+def test_wait_without_result_is_not_success():
+    scheduler = make_scheduler(FakeSheetsService(), FakeClock())
+    ticket = scheduler.enqueue('sheet-1', 'B1:O300', [['x']])
+
+    result = scheduler.wait(ticket, timeout=0.01)
+
+    assert result['success'] is False
+
+
+def test_write_products_to_sheet_reports_failure_flushed_by_another_caller(scraper, monkeypatch):
+    class FailingSheetOne(FakeSheetsService):
+        def values_batch_update(self, spreadsheet_id, body):
+            if spreadsheet_id == 'sheet-1':
+                raise FakeAPIError(400)
+            return super().values_batch_update(spreadsheet_id, body)
+
+    scheduler = make_scheduler(FailingSheetOne(), FakeClock())
+    monkeypatch.setattr(scraper, 'GSPREAD_AVAILABLE', True)
+    monkeypatch.setattr(scraper, '_sheets_scheduler', scheduler)
+    products = [{'name': '商品', 'price': '1,000円'}]
+
+    queued = scraper.write_products_to_sheet('sheet-1', products, flush=False)
+    assert queued['queued'] is True
+
+    # 別の呼び出し元の書き込みが flush を実行し、sheet-1 の書き込みは失敗する
+    other = scraper.write_products_to_sheet('sheet-2', products)
+    assert other['success'] is True
+
+    result = scraper.wait_sheet_write(queued['ticket'], len(products))
+    assert result['success'] is False
+    assert result['statusCode'] == 400